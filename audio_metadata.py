@@ -0,0 +1,496 @@
+"""
+Audio Metadata
+Reads duration and stream info from audio container headers without decoding
+"""
+import json
+import os
+import struct
+import queue
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+AudioInfo = namedtuple('AudioInfo', ['duration', 'bitrate', 'sample_rate', 'channels'])
+
+CACHE_VERSION = 1
+
+# MPEG audio tables, indexed by [version][layer] (version: 1 = MPEG1, 2 = MPEG2/2.5)
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],   # MPEG1
+    2: [22050, 24000, 16000],   # MPEG2
+    0: [11025, 12000, 8000],    # MPEG2.5
+}
+
+
+def read_audio_info(path: str) -> Optional[AudioInfo]:
+    """
+    Read stream information from a file's headers
+
+    Args:
+        path: Path to an MP3, OGG, FLAC, WAV or M4A file
+
+    Returns:
+        AudioInfo: Duration in seconds, bitrate in kbps, sample rate and channels,
+            or None if the format is not recognised
+    """
+    with open(path, 'rb') as f:
+        head = f.read(16)
+        f.seek(0)
+
+        if head.startswith(b'fLaC'):
+            return _read_flac(f)
+        if head.startswith(b'OggS'):
+            return _read_ogg(f)
+        if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+            return _read_wav(f)
+        if head[4:8] == b'ftyp':
+            return _read_mp4(f)
+        return _read_mp3(f)
+
+
+def _file_size(f) -> int:
+    return os.fstat(f.fileno()).st_size
+
+
+def _read_mp3(f) -> Optional[AudioInfo]:
+    """Parse the first MPEG frame header and a Xing/Info or VBRI header if present"""
+    size = _file_size(f)
+    audio_start = 0
+
+    # Skip ID3v2 tag (size is a 28-bit syncsafe integer)
+    header = f.read(10)
+    if header[:3] == b'ID3' and len(header) == 10:
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        audio_start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    f.seek(audio_start)
+    data = f.read(64 * 1024)
+
+    for offset in range(len(data) - 4):
+        if data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+            continue
+
+        b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+        version_bits = (b1 >> 3) & 0x3
+        layer_bits = (b1 >> 1) & 0x3
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x3
+        if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+
+        version = 1 if version_bits == 3 else 2
+        layer = 4 - layer_bits
+        bitrate = MP3_BITRATES[(version, layer)][bitrate_index]
+        sample_rate = MP3_SAMPLE_RATES[version_bits][rate_index]
+        channels = 1 if (b3 >> 6) == 3 else 2
+
+        if layer == 1:
+            samples_per_frame = 384
+        elif layer == 3 and version == 2:
+            samples_per_frame = 576
+        else:
+            samples_per_frame = 1152
+
+        # Xing/Info header sits after the side information in the first frame
+        if version == 1:
+            side_info = 17 if channels == 1 else 32
+        else:
+            side_info = 9 if channels == 1 else 17
+        frames = _mp3_vbr_frames(data, offset + 4 + side_info, offset + 4 + 32)
+
+        if frames:
+            duration = frames * samples_per_frame / sample_rate
+            audio_bytes = size - audio_start - offset
+            if duration > 0:
+                bitrate = int(audio_bytes * 8 / duration / 1000)
+        else:
+            audio_bytes = size - audio_start - offset
+            f.seek(max(0, size - 128))
+            if f.read(3) == b'TAG':
+                audio_bytes -= 128
+            duration = audio_bytes * 8 / (bitrate * 1000)
+
+        return AudioInfo(duration, bitrate, sample_rate, channels)
+
+    return None
+
+
+def _mp3_vbr_frames(data: bytes, xing_offset: int, vbri_offset: int) -> Optional[int]:
+    """Get the frame count from a Xing/Info or VBRI header"""
+    tag = data[xing_offset:xing_offset + 4]
+    if tag in (b'Xing', b'Info') and len(data) >= xing_offset + 12:
+        flags = struct.unpack('>I', data[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x1:
+            return struct.unpack('>I', data[xing_offset + 8:xing_offset + 12])[0]
+
+    if data[vbri_offset:vbri_offset + 4] == b'VBRI' and len(data) >= vbri_offset + 18:
+        return struct.unpack('>I', data[vbri_offset + 14:vbri_offset + 18])[0]
+
+    return None
+
+
+def _read_flac(f) -> Optional[AudioInfo]:
+    """Parse the FLAC STREAMINFO block"""
+    f.seek(4)
+    block_header = f.read(4)
+    if len(block_header) < 4 or (block_header[0] & 0x7F) != 0:
+        return None
+
+    info = f.read(34)
+    if len(info) < 34:
+        return None
+
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate:
+        return None
+
+    duration = total_samples / sample_rate
+    bitrate = int(_file_size(f) * 8 / duration / 1000) if duration else 0
+    return AudioInfo(duration, bitrate, sample_rate, channels)
+
+
+def _read_ogg(f) -> Optional[AudioInfo]:
+    """Parse the Vorbis or Opus identification header and the last page's granule position"""
+    first_page = f.read(512)
+    segments = first_page[26]
+    packet = first_page[27 + segments:]
+
+    if packet.startswith(b'\x01vorbis'):
+        channels = packet[11]
+        sample_rate, _max, nominal, _min = struct.unpack('<IiiI', packet[12:28])
+        granule_rate = sample_rate
+        pre_skip = 0
+        bitrate = nominal // 1000 if nominal > 0 else 0
+    elif packet.startswith(b'OpusHead'):
+        channels = packet[9]
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+        sample_rate = struct.unpack('<I', packet[12:16])[0] or 48000
+        # Opus granule positions always count 48 kHz samples
+        granule_rate = 48000
+        bitrate = 0
+    else:
+        return None
+
+    size = _file_size(f)
+    f.seek(max(0, size - 64 * 1024))
+    tail = f.read()
+    last_page = tail.rfind(b'OggS')
+    if last_page < 0 or last_page + 14 > len(tail):
+        return None
+
+    granule = struct.unpack('<q', tail[last_page + 6:last_page + 14])[0]
+    duration = max(0, granule - pre_skip) / granule_rate
+    if not bitrate and duration:
+        bitrate = int(size * 8 / duration / 1000)
+    return AudioInfo(duration, bitrate, sample_rate, channels)
+
+
+def _read_wav(f) -> Optional[AudioInfo]:
+    """Walk RIFF chunks for 'fmt ' and 'data'"""
+    f.seek(12)
+    fmt = None
+
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', f.read(16))
+            f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+        elif chunk_id == b'data':
+            if not fmt:
+                return None
+            _format, channels, sample_rate, byte_rate, _align, _bits = fmt
+            if not byte_rate:
+                return None
+            # Streamed WAVs may leave the size at 0 or 0xFFFFFFFF
+            data_size = chunk_size
+            if data_size in (0, 0xFFFFFFFF):
+                data_size = _file_size(f) - f.tell()
+            return AudioInfo(data_size / byte_rate, byte_rate * 8 // 1000, sample_rate, channels)
+        else:
+            f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _read_mp4(f) -> Optional[AudioInfo]:
+    """Find moov/mvhd for the duration and the first audio sample entry for the format"""
+    size = _file_size(f)
+    moov = _find_atom(f, 0, size, b'moov')
+    if not moov:
+        return None
+
+    mvhd = _find_atom(f, moov[0], moov[1], b'mvhd')
+    if not mvhd:
+        return None
+
+    f.seek(mvhd[0])
+    version = f.read(4)[0]
+    if version == 1:
+        f.seek(16, 1)
+        timescale, duration_units = struct.unpack('>IQ', f.read(12))
+    else:
+        f.seek(8, 1)
+        timescale, duration_units = struct.unpack('>II', f.read(8))
+    if not timescale:
+        return None
+
+    duration = duration_units / timescale
+    sample_rate = 0
+    channels = 0
+
+    # moov/trak/mdia/minf/stbl/stsd holds the audio sample entry
+    atom = moov
+    for name in (b'trak', b'mdia', b'minf', b'stbl', b'stsd'):
+        atom = _find_atom(f, atom[0], atom[1], name) if atom else None
+    if atom:
+        f.seek(atom[0] + 8)
+        entry = f.read(36)
+        if len(entry) == 36:
+            channels = struct.unpack('>H', entry[24:26])[0]
+            sample_rate = struct.unpack('>I', entry[32:36])[0] >> 16
+
+    bitrate = int(size * 8 / duration / 1000) if duration else 0
+    return AudioInfo(duration, bitrate, sample_rate, channels)
+
+
+def _find_atom(f, start: int, end: int, name: bytes):
+    """Find a child atom, returning (content start, content end)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        atom_size, atom_name = struct.unpack('>I4s', header)
+        header_size = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = end - position
+        if atom_size < header_size:
+            return None
+        if atom_name == name:
+            return position + header_size, position + atom_size
+        position += atom_size
+    return None
+
+
+class MetadataIndexer:
+    """Indexes audio metadata on background worker threads with a persistent cache"""
+
+    def __init__(self, cache_path: Optional[str] = None, workers: int = 2):
+        """
+        Initialize metadata indexer
+
+        Args:
+            cache_path: Path of the cache file, or None to keep it in memory only
+            workers: Number of files read concurrently
+        """
+        self.cache_path = cache_path
+        self.workers = max(1, workers)
+
+        # Path -> [size, mtime_ns, duration, bitrate, sample_rate, channels]
+        self.entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._threads = []
+        self._pending = 0
+        self._dirty = False
+
+        self.load()
+
+    def load(self):
+        """Load cache from file"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.entries = data.get('entries', {})
+                logger.info(f"Metadata cache loaded with {len(self.entries)} entries")
+        except Exception as e:
+            logger.error(f"Error loading metadata cache: {e}")
+
+    def save(self) -> bool:
+        """Save cache to file atomically"""
+        if not self.cache_path:
+            return True
+
+        with self._lock:
+            if not self._dirty:
+                return True
+            data = {'version': CACHE_VERSION, 'entries': dict(self.entries)}
+            self._dirty = False
+
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.cache_path)
+            logger.info(f"Metadata cache saved to {self.cache_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving metadata cache: {e}")
+            return False
+
+    def submit(self, paths: Iterable[str]):
+        """
+        Index files in the background
+
+        Files whose size and mtime match the cache are not read again. The
+        cache is saved each time the queue of submitted files runs empty.
+
+        Args:
+            paths: Audio file paths to index
+        """
+        paths = list(paths)
+        if not paths:
+            return
+
+        with self._lock:
+            self._pending += len(paths)
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._worker, name=f'metadata-{i}',
+                                              daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+        for path in paths:
+            self._queue.put(path)
+
+    def prune(self, scope: str, keep: Iterable[str], outside: bool = False):
+        """
+        Forget files below a directory that are no longer in the library
+
+        The cache is saved with the next batch of submitted files, or on shutdown.
+
+        Args:
+            scope: Directory whose entries are checked
+            keep: Paths of files, or of directories directly below scope, whose
+                entries stay
+            outside: If True, also forget every file outside scope, e.g. of a
+                previous library path
+        """
+        keep = set(keep)
+        prefix = os.path.join(scope, '')
+
+        with self._lock:
+            stale = [path for path in self.entries
+                     if (outside and not path.startswith(prefix)) or
+                     (path.startswith(prefix) and path not in keep and
+                      prefix + path[len(prefix):].split(os.sep, 1)[0] not in keep)]
+            for path in stale:
+                del self.entries[path]
+            if stale:
+                self._dirty = True
+
+        if stale:
+            logger.info(f"Forgot metadata of {len(stale)} files no longer in the library")
+
+    def shutdown(self):
+        """Stop the worker threads and persist the cache"""
+        # Drop work that has not started yet; files being read still count themselves down
+        dropped = 0
+        try:
+            while True:
+                if self._queue.get_nowait() is not None:
+                    dropped += 1
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+            self._pending = max(0, self._pending - dropped)
+
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=2.0)
+
+        self.save()
+
+    def get(self, path: str) -> Optional[AudioInfo]:
+        """Get cached metadata for a file, or None if it is not indexed yet"""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        return AudioInfo(*entry[2:])
+
+    def get_duration(self, path: str) -> Optional[float]:
+        """Get cached duration of a file in seconds"""
+        entry = self.entries.get(path)
+        return entry[2] if entry else None
+
+    def get_total_duration(self, paths: Iterable[str]) -> float:
+        """Sum of the known durations of the given files"""
+        total = 0.0
+        for path in paths:
+            entry = self.entries.get(path)
+            if entry:
+                total += entry[2]
+        return total
+
+    def _worker(self):
+        """Index queued files until a None sentinel arrives"""
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+
+            self._index_file(path)
+
+            with self._lock:
+                self._pending = max(0, self._pending - 1)
+                finished = self._pending == 0
+            if finished:
+                self.save()
+
+    def _index_file(self, path: str) -> bool:
+        """Read metadata for one file unless the cached entry is current"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        entry = self.entries.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return False
+
+        try:
+            info = read_audio_info(path)
+        except Exception as e:
+            logger.warning(f"Could not read metadata for {path}: {e}")
+            info = None
+
+        # Unreadable files are cached too, so they are not retried until they change
+        if info is None:
+            info = AudioInfo(0.0, 0, 0, 0)
+
+        with self._lock:
+            self.entries[path] = [st.st_size, st.st_mtime_ns, round(info.duration, 3),
+                                  info.bitrate, info.sample_rate, info.channels]
+            self._dirty = True
+        return True
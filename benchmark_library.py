@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Library Benchmark
+Generates synthetic music libraries and measures MusicLibrary operations
+
+Usage:
+    python benchmark_library.py                      # 1k and 10k tracks
+    python benchmark_library.py --sizes 1000 100000  # custom sizes
+    python benchmark_library.py --output bench.json  # write results to a file
+
+The retained_memory result gives the bytes per track a scanned library keeps.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from music_library import MusicLibrary
+
+# Layout of generated trees: every playlist has ARTISTS x ALBUMS x SONGS tracks
+ARTISTS_PER_PLAYLIST = 10
+ALBUMS_PER_ARTIST = 10
+SONGS_PER_ALBUM = 10
+
+# Generated directories get an old mtime so the library index trusts them
+FIXED_MTIME = 1577836800  # 2020-01-01
+
+COUNTED_CALLS = ['stat', 'lstat', 'scandir', 'listdir']
+
+
+def generate_tree(root: str, tracks: int):
+    """
+    Generate <nfc_id>/<seq>_<artist>/<seq>_<album>/<seq>_<song>.mp3 placeholders
+
+    Args:
+        root: Directory to create the library in
+        tracks: Number of tracks (rounded up to whole albums)
+    """
+    marker = os.path.join(root, '.generated')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read().strip() == str(tracks):
+                return
+        shutil.rmtree(root)
+
+    print(f"Generating {tracks} track library in {root}...", file=sys.stderr)
+    os.makedirs(root, exist_ok=True)
+    directories = [root]
+    remaining = tracks
+    playlist = 0
+
+    while remaining > 0:
+        playlist_path = os.path.join(root, f"{1000000 + playlist}")
+        directories.append(playlist_path)
+        for artist in range(1, ARTISTS_PER_PLAYLIST + 1):
+            artist_path = os.path.join(playlist_path, f"{artist:02d}_synthetic_artist_{artist}")
+            directories.append(artist_path)
+            for album in range(1, ALBUMS_PER_ARTIST + 1):
+                if remaining <= 0:
+                    break
+                album_path = os.path.join(artist_path, f"{album:02d}_synthetic_album_{album}")
+                os.makedirs(album_path)
+                directories.append(album_path)
+                with open(os.path.join(album_path, "albumart.png"), 'wb'):
+                    pass
+                for song in range(1, SONGS_PER_ALBUM + 1):
+                    with open(os.path.join(album_path, f"{song:02d}_synthetic_song_{song}.mp3"), 'wb') as f:
+                        f.write(b'\xff\xfb\x90\x00')
+                remaining -= SONGS_PER_ALBUM
+        playlist += 1
+
+    for directory in reversed(directories):
+        os.utime(directory, (FIXED_MTIME, FIXED_MTIME))
+
+    with open(marker, 'w') as f:
+        f.write(str(tracks))
+    os.utime(root, (FIXED_MTIME, FIXED_MTIME))
+
+
+def drop_caches() -> bool:
+    """Drop the kernel page, dentry and inode caches (needs root)"""
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def read_proc_io() -> dict:
+    """Read syscall counters for this process, if the kernel exposes them"""
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+@contextmanager
+def count_calls(counts: dict):
+    """Count filesystem calls made through the os module"""
+    originals = {name: getattr(os, name) for name in COUNTED_CALLS}
+    lock = threading.Lock()
+
+    # Scans run on several threads
+    def wrap(name, func):
+        def counted(*args, **kwargs):
+            with lock:
+                counts[name] = counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return counted
+
+    for name, func in originals.items():
+        setattr(os, name, wrap(name, func))
+    try:
+        yield counts
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+
+
+def measure(name: str, func, setup=None, memory: bool = True) -> dict:
+    """
+    Run an operation and collect wall time, filesystem calls and memory
+
+    Args:
+        name: Operation name
+        func: Operation to run, receives the value returned by setup
+        setup: Optional callable run (unmeasured) before each pass
+        memory: If True, run an extra pass under tracemalloc for peak memory
+    """
+    state = setup() if setup else None
+    gc.collect()
+    io_before = read_proc_io()
+    calls = {}
+
+    with count_calls(calls):
+        start = time.perf_counter()
+        func(state)
+        wall = time.perf_counter() - start
+
+    io_after = read_proc_io()
+    result = {
+        'operation': name,
+        'wall_s': round(wall, 6),
+        'fs_calls': calls,
+        'read_syscalls': io_after.get('syscr', 0) - io_before.get('syscr', 0) if io_before else None,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    if memory:
+        state = setup() if setup else None
+        gc.collect()
+        tracemalloc.start()
+        func(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_python_bytes'] = peak
+
+    return result
+
+
+def measure_retained(library_path: str, tracks: int, workers: int) -> dict:
+    """
+    Measure the memory a scanned library keeps per track
+
+    Counts what is still allocated after scan_library() returns, with and
+    without the in-memory library index. Song file names are shared with the
+    index listings, so they stay counted once the index is dropped.
+
+    Args:
+        library_path: Generated library to scan
+        tracks: Number of tracks in the library
+        workers: Scan worker threads
+    """
+    gc.collect()
+    tracemalloc.start()
+    library = MusicLibrary(library_path, scan_workers=workers)
+    library.scan_library()
+    gc.collect()
+    with_index, _ = tracemalloc.get_traced_memory()
+
+    library.index = None
+    gc.collect()
+    tree, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'operation': 'retained_memory',
+        'retained_bytes': tree,
+        'bytes_per_track': round(tree / tracks, 1),
+        'bytes_per_track_with_index': round(with_index / tracks, 1)
+    }
+
+
+def benchmark_size(root: str, tracks: int, args) -> list:
+    """Run all operations against a library of the given size"""
+    library_path = os.path.join(root, f"library_{tracks}")
+    generate_tree(library_path, tracks)
+
+    work_dir = tempfile.mkdtemp(prefix='jukebox-bench-')
+    index_path = os.path.join(work_dir, 'library_index.json')
+    results = []
+
+    def new_library(index=None, lazy=False):
+        return MusicLibrary(library_path, index_path=index,
+                            scan_workers=args.workers, lazy=lazy)
+
+    def cold_setup():
+        if args.drop_caches and not drop_caches():
+            print("Could not drop caches (needs root), cold runs use warm caches",
+                  file=sys.stderr)
+        return None
+
+    # Cold: no library index
+    results.append(measure(
+        'scan_library_cold',
+        lambda _: new_library().scan_library(),
+        setup=cold_setup,
+        memory=args.memory
+    ))
+
+    # Warm: fresh process state, existing library index on disk
+    new_library(index_path).scan_library()
+    results.append(measure(
+        'scan_library_warm',
+        lambda _: new_library(index_path).scan_library(),
+        memory=args.memory
+    ))
+
+    results.append(measure(
+        'scan_library_lazy',
+        lambda _: new_library(index_path, lazy=True).scan_library(),
+        memory=args.memory
+    ))
+
+    library = new_library(index_path)
+    library.scan_library()
+    nfc_ids = library.get_playlist_ids()
+
+    results.append(measure(
+        'get_all_songs',
+        lambda _: [library.get_all_songs(nfc_id) for nfc_id in nfc_ids
+                   for _ in range(args.repeat)],
+        memory=args.memory
+    ))
+
+    def song_info(_):
+        for nfc_id in nfc_ids:
+            playlist = library.get_playlist(nfc_id)
+            for song in library.get_all_songs(nfc_id):
+                library.get_song_info(song, playlist)
+
+    results.append(measure('get_song_info', song_info, memory=args.memory))
+
+    if args.memory:
+        results.append(measure_retained(library_path, tracks, args.workers))
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    for result in results:
+        result['tracks'] = tracks
+        result['playlists'] = len(nfc_ids)
+    return results
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark music library operations")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help="Library sizes in tracks (default: 1000 10000)")
+    parser.add_argument('--root', default=os.path.join(tempfile.gettempdir(), 'jukebox-bench'),
+                        help="Where generated libraries are kept between runs")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Scan worker threads (default: 4)")
+    parser.add_argument('--repeat', type=int, default=100,
+                        help="get_all_songs calls per playlist (default: 100)")
+    parser.add_argument('--drop-caches', action='store_true',
+                        help="Drop kernel caches before cold scans (needs root)")
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="Skip the tracemalloc passes for peak and retained memory")
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Per-playlist log lines would dominate the timings
+    logging.getLogger('music_library').setLevel(logging.ERROR)
+    logging.getLogger('library_index').setLevel(logging.ERROR)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'workers': args.workers,
+        'results': []
+    }
+
+    for tracks in args.sizes:
+        report['results'].extend(benchmark_size(args.root, tracks, args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Transcode Cache Check
+Runs TranscodeCache end to end with WAV input and a Python copy "encoder"
+
+Needs no ffmpeg or other encoder. Exits with status 1 if a check fails.
+
+Usage:
+    python check_transcode_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+import wave
+
+from transcode_cache import CommandEncoder, TranscodeCache
+
+# Copies input to output; stands in for a real encoder
+COPY_ENCODER = [sys.executable, '-c',
+                'import shutil, sys; shutil.copyfile(sys.argv[1], sys.argv[2])',
+                '{input}', '{output}']
+# Fails every file
+FAILING_ENCODER = [sys.executable, '-c', 'import sys; sys.exit("encoder failed")',
+                   '{input}', '{output}']
+
+
+def write_wav(path: str, frames: int, value: int = 0):
+    """Write a mono 16-bit WAV file of constant samples"""
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes(value.to_bytes(2, 'little', signed=True) * frames)
+
+
+def wait_idle(cache: TranscodeCache, timeout: float = 60.0) -> bool:
+    """Wait until every submitted file is done"""
+    deadline = time.monotonic() + timeout
+    while cache.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return cache.pending() == 0
+
+
+def check(name: str, ok: bool, failures: list):
+    """Print and collect one check result"""
+    print(f"  {'✓' if ok else '✗'} {name}")
+    if not ok:
+        failures.append(name)
+
+
+def main():
+    """Main entry point"""
+    failures = []
+    with tempfile.TemporaryDirectory() as root:
+        music = os.path.join(root, 'music')
+        cache_dir = os.path.join(root, 'cache')
+        os.makedirs(music)
+        first = os.path.join(music, 'a.wav')
+        same = os.path.join(music, 'b.wav')
+        other = os.path.join(music, 'c.wav')
+        write_wav(first, 22050)
+        write_wav(same, 22050)
+        write_wav(other, 22050, value=100)
+
+        print("Transcoding with a copy encoder...")
+        cache = TranscodeCache(cache_dir, 10 * 1024 * 1024,
+                               CommandEncoder(COPY_ENCODER, '.wav'), extensions=['.wav'])
+        cache.submit([first, same, other])
+        check("all jobs finish", wait_idle(cache), failures)
+        check("every file has a copy", all(cache.get_path(p) for p in (first, same, other)), failures)
+        check("identical files share one copy", cache.get_path(first) == cache.get_path(same), failures)
+        check("different files get different copies", cache.get_path(first) != cache.get_path(other),
+              failures)
+        with open(first, 'rb') as src, open(cache.get_path(first), 'rb') as dst:
+            check("copy matches its source", src.read() == dst.read(), failures)
+        cache.shutdown()
+
+        print("Reloading the cache...")
+        cache = TranscodeCache(cache_dir, 10 * 1024 * 1024,
+                               CommandEncoder(COPY_ENCODER, '.wav'), extensions=['.wav'])
+        cache.submit([first, same, other])
+        check("unchanged files are not queued again", cache.pending() == 0, failures)
+        check("copies survive a restart", cache.get_path(other) is not None, failures)
+
+        write_wav(other, 22050, value=200)
+        check("replaced files have no copy", cache.get_path(other) is None, failures)
+        check("replaced files are transcoded again", wait_idle(cache), failures)
+        with open(other, 'rb') as src, open(cache.get_path(other), 'rb') as dst:
+            check("new copy matches the replaced file", src.read() == dst.read(), failures)
+        cache.shutdown()
+
+        print("Transcoding with a failing encoder...")
+        failing_dir = os.path.join(root, 'failing')
+        cache = TranscodeCache(failing_dir, 10 * 1024 * 1024,
+                               CommandEncoder(FAILING_ENCODER, '.wav'), extensions=['.wav'])
+        cache.submit([first])
+        check("failed jobs finish", wait_idle(cache), failures)
+        check("failed files have no copy", cache.get_path(first) is None, failures)
+        cache.submit([first])
+        check("failed files are not retried until they change", cache.pending() == 0, failures)
+        cache.shutdown()
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\nAll checks passed")
+
+
+if __name__ == "__main__":
+    main()
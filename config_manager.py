@@ -10,8 +10,47 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_CONFIG = {
     "music_library_path": "music",
+    "library_index_path": "library_index.json",
+    "library_scan_workers": 4,
+    "library_lazy_loading": False,
+    "library_cache_playlists": 16,
+    "library_cache_songs": 20000,
+    "library_watch": True,
+    "library_watch_poll_interval": 10,
+    "metadata_cache_path": "audio_metadata.json",
+    "metadata_workers": 2,
+    "quarantine_path": "quarantine.json",
     "stop_nfc_id": None,
+    "rfid_removal_grace": 1.5,
+    "rfid_arrival_debounce": 0.0,
+    "pause_on_tag_removal": False,
+    "rfid_poll_fast": 0.1,
+    "rfid_poll_slow": 1.0,
+    "rfid_poll_idle_after": 10,
+    "rfid_poll_decay": 1.5,
+    "rfid_read_data": False,
     "volume": 0.7,
+    "loudness_normalization": "off",
+    "loudness_cache_path": "loudness.json",
+    "loudness_target_db": -18.0,
+    "loudness_workers": 1,
+    "gapless_playback": False,
+    "resume_playback": True,
+    "resume_journal_path": "resume_journal.jsonl",
+    "resume_save_interval": 5,
+    "staging_cache_path": None,
+    "staging_cache_mb": 512,
+    "staging_lookahead": 2,
+    "sound_cache_mb": 64,
+    "sound_cache_max_seconds": 30,
+    "transcode_cache_path": None,
+    "transcode_cache_mb": 2048,
+    "transcode_encoder": "ffmpeg-vorbis",
+    "transcode_extensions": [".flac", ".m4a"],
+    "transcode_workers": 1,
+    "latency_tracking": False,
+    "latency_window": 500,
+    "latency_log_interval": 60,
     "nfc_mappings": {},
     "debug_mode": False
 }
@@ -0,0 +1,133 @@
+"""
+Job Runner
+Runs a cache's background jobs on a spawned process pool, a few at a time
+"""
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessJobRunner:
+    """Feeds jobs to a process pool and counts them until every one has ended"""
+
+    def __init__(self, name: str, workers: int, on_result: Callable[[object, Future], None],
+                 on_idle: Callable[[], None], initializer: Optional[Callable[[], None]] = None):
+        """
+        Initialize job runner
+
+        Args:
+            name: Name used in log messages and thread names, e.g. "Transcode"
+            workers: Number of pool processes
+            on_result: Called from a pool callback thread with a job's context and
+                its finished future; not called for jobs that were cancelled,
+                never submitted or lost with a broken pool
+            on_idle: Called once no submitted job is left, unless shut down
+            initializer: Run once in every pool process
+        """
+        self.name = name
+        self.workers = max(1, workers)
+        self.on_result = on_result
+        self.on_idle = on_idle
+        self.initializer = initializer
+        self._lock = threading.Lock()
+        # Bounds how many jobs wait in the pool's own queue
+        self._slots = threading.Semaphore(self.workers * 2)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._closed = False
+
+    def submit(self, func: Callable, jobs: List[tuple]) -> bool:
+        """
+        Run jobs in the background
+
+        Args:
+            func: Picklable function run in a pool process
+            jobs: (args for func, context passed to on_result) tuples
+
+        Returns:
+            bool: False if the runner is shut down and the jobs were dropped
+        """
+        if not jobs:
+            return True
+
+        with self._lock:
+            if self._closed:
+                return False
+            self._pending += len(jobs)
+            if self._pool is None:
+                # Spawned workers don't inherit the player's threads or mixer
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer
+                )
+
+        threading.Thread(target=self._feed, args=(func, jobs),
+                         name=f'{self.name.lower()}-feed', daemon=True).start()
+        return True
+
+    def pending(self) -> int:
+        """Number of submitted jobs that have not ended yet"""
+        with self._lock:
+            return self._pending
+
+    def shutdown(self):
+        """Cancel queued jobs; running ones finish in their processes"""
+        with self._lock:
+            self._closed = True
+            pool = self._pool
+            self._pool = None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _feed(self, func: Callable, jobs: List[tuple]):
+        """Submit jobs to the pool a few at a time"""
+        for i, (args, context) in enumerate(jobs):
+            self._slots.acquire()
+            with self._lock:
+                pool = self._pool
+            try:
+                if pool is None:
+                    raise RuntimeError("pool is gone")
+                future = pool.submit(func, *args)
+            except RuntimeError:
+                # Pool shut down or broke; the rest of the jobs will never run
+                self._slots.release()
+                self._drop(len(jobs) - i)
+                return
+            future.add_done_callback(lambda f, c=context, p=pool: self._done(f, c, p))
+
+    def _done(self, future: Future, context, pool: ProcessPoolExecutor):
+        """Hand a finished job to on_result and count it as ended"""
+        self._slots.release()
+        try:
+            if future.cancelled():
+                return
+
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                # A worker died; the next submit starts a new pool and retries
+                logger.error(f"{self.name} worker failed: {error}")
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                return
+
+            self.on_result(context, future)
+        except Exception as e:
+            logger.error(f"Error handling {self.name.lower()} result: {e}")
+        finally:
+            self._drop(1)
+
+    def _drop(self, count: int):
+        """Count jobs that ended, calling on_idle once none are left"""
+        with self._lock:
+            self._pending = max(0, self._pending - count)
+            idle = self._pending == 0 and not self._closed
+        if idle:
+            self.on_idle()
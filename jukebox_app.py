@@ -8,15 +8,26 @@ import pygame
 import logging
 import os
 import threading
+import time
 from typing import Optional
 
 # Use pygame for all image handling (no PIL/Pillow needed)
 PILLOW_AVAILABLE = False
 
-from rfid_reader import RFIDReader
+from rfid_reader import RFIDReader, PollSchedule, TAG_REMOVED
 from music_library import MusicLibrary, Song
+from library_watcher import LibraryWatcher
+from audio_metadata import MetadataIndexer
+from staging_cache import StagingCache
+from sound_cache import SoundCache
+from transcode_cache import TranscodeCache, make_encoder
+from loudness import LoudnessAnalyzer, NUMPY_AVAILABLE
+from quarantine import Quarantine
+from resume_journal import ResumeJournal
 from music_player import MusicPlayer
+from player_worker import PlayerWorker
 from config_manager import ConfigManager
+from latency import LatencyTracker
 
 # Set up logging
 logging.basicConfig(
@@ -29,13 +40,15 @@ logger = logging.getLogger(__name__)
 class JukeboxApp:
     """Main Jukebox Application"""
     
-    def __init__(self, root, mock_rfid=False):
+    def __init__(self, root, mock_rfid=False, rfid_chip=None, config_file="config.json"):
         """
         Initialize jukebox app
         
         Args:
             root: Tkinter root window
             mock_rfid: Use mock RFID reader for testing
+            rfid_chip: Mock chip to read tags from, e.g. a ReplayMFRC522
+            config_file: Path to configuration file
         """
         self.root = root
         self.root.title("Jukebox")
@@ -51,18 +64,109 @@ class JukeboxApp:
         pygame.init()
         
         # Initialize components
-        self.config = ConfigManager()
-        self.rfid_reader = RFIDReader(mock_mode=mock_rfid)
-        self.music_library = MusicLibrary(self.config.get_music_library_path())
-        self.music_player = MusicPlayer()
+        self.config = ConfigManager(config_file)
+        self.rfid_reader = RFIDReader(
+            mock_mode=mock_rfid,
+            removal_grace=self.config.get('rfid_removal_grace', 1.5),
+            arrival_debounce=self.config.get('rfid_arrival_debounce', 0.0),
+            poll_schedule=PollSchedule(
+                fast=self.config.get('rfid_poll_fast', 0.1),
+                slow=self.config.get('rfid_poll_slow', 1.0),
+                idle_after=self.config.get('rfid_poll_idle_after', 10),
+                decay=self.config.get('rfid_poll_decay', 1.5)
+            ),
+            read_data=self.config.get('rfid_read_data', False),
+            chip=rfid_chip
+        )
+        self.music_library = MusicLibrary(
+            self.config.get_music_library_path(),
+            index_path=self.config.get('library_index_path'),
+            scan_workers=self.config.get('library_scan_workers', 4),
+            lazy=self.config.get('library_lazy_loading', False),
+            max_cached_playlists=self.config.get('library_cache_playlists', 16),
+            max_cached_songs=self.config.get('library_cache_songs', 20000)
+        )
+        self.music_player = MusicPlayer(gapless=self.config.get('gapless_playback', False))
+        self.metadata = MetadataIndexer(
+            self.config.get('metadata_cache_path'),
+            workers=self.config.get('metadata_workers', 2)
+        )
+        self.music_player.metadata = self.metadata
+        self.quarantine = Quarantine(self.config.get('quarantine_path'))
+        self.music_player.quarantine = self.quarantine
+        
+        self.staging_cache = None
+        if self.config.get('staging_cache_path'):
+            self.staging_cache = StagingCache(
+                self.config.get('staging_cache_path'),
+                self.config.get('staging_cache_mb', 512) * 1024 * 1024,
+                lookahead=self.config.get('staging_lookahead', 2)
+            )
+            self.music_player.staging = self.staging_cache
+        
+        self.transcode_cache = None
+        if self.config.get('transcode_cache_path'):
+            self.transcode_cache = self.create_transcode_cache()
+            self.music_player.transcodes = self.transcode_cache
+        
+        self.loudness = None
+        loudness_mode = self.config.get('loudness_normalization', 'off')
+        if loudness_mode in ('album', 'track'):
+            if NUMPY_AVAILABLE:
+                self.loudness = LoudnessAnalyzer(
+                    self.config.get('loudness_cache_path'),
+                    workers=self.config.get('loudness_workers', 1),
+                    target_db=self.config.get('loudness_target_db', -18.0)
+                )
+                self.music_player.loudness = self.loudness
+                self.music_player.album_gain = loudness_mode == 'album'
+            else:
+                logger.warning("numpy not available, loudness normalisation disabled")
+        
+        self.sound_cache = None
+        if self.config.get('sound_cache_mb', 64) > 0:
+            self.sound_cache = SoundCache(
+                self.config.get('sound_cache_mb', 64) * 1024 * 1024,
+                max_duration=self.config.get('sound_cache_max_seconds', 30)
+            )
+            self.music_player.sounds = self.sound_cache
         
-        # Set up music player callback
-        self.music_player.on_song_change = self.on_song_change
+        self.resume_journal = None
+        if self.config.get('resume_playback', True):
+            self.resume_journal = ResumeJournal(
+                self.config.get('resume_journal_path'),
+                flush_interval=self.config.get('resume_save_interval', 5)
+            )
+        
+        self.library_watcher = None
+        
+        self.latency = None
+        if self.config.get('latency_tracking', False):
+            self.latency = LatencyTracker(window=self.config.get('latency_window', 500))
+            self.rfid_reader.latency = self.latency
+            self.music_player.latency = self.latency
+        
+        # All mixer calls go through the audio thread; song changes come back via root.after
+        self.player = PlayerWorker(
+            self.music_player,
+            dispatch=lambda func: self.root.after(0, func)
+        )
+        self.player.on_song_change = self.on_song_change
+        self.player.latency = self.latency
+        self.player.start()
+        self.player.set_volume(self.config.get('volume', 0.7))
         
         # State
         self.current_playlist = None
         self.debug_mode = False
         self.rfid_read_mode = False
+        # Tag whose removal paused playback; putting it back resumes
+        self.paused_tag = None
+        self.rfid_health_job = None
+        self.latency_label = None
+        self.search_job = None
+        # Lazy libraries index every playlist only while the search is shown
+        self.search_all = False
         self.stop_nfc_config_mode = False
         
         # UI components
@@ -83,12 +187,22 @@ class JukeboxApp:
         
         # Scan music library
         self.music_library.scan_library()
+        self.index_metadata()
+        self.update_search_index()
+        
+        # Pick up changes to the library without a rescan
+        if self.config.get('library_watch', True):
+            self.start_library_watcher()
         
-        # Start RFID polling
-        self.poll_rfid()
+        # Tags are read on the reader's own thread and handled here on the Tk thread
+        self.rfid_reader.start(on_event=lambda: self.root.after(0, self.process_rfid_events))
         
-        # Start pygame event loop
-        self.check_pygame_events()
+        # Remember playback positions for resuming tags
+        if self.resume_journal:
+            self.track_resume_position()
+        
+        if self.latency:
+            self.root.after(int(self.config.get('latency_log_interval', 60) * 1000), self.log_latency)
         
         logger.info("Jukebox app initialized")
     
@@ -197,7 +311,8 @@ class JukeboxApp:
         """Show debug configuration window"""
         self.debug_window = tk.Toplevel(self.root)
         self.debug_window.title("Debug Menu")
-        self.debug_window.geometry("400x500")
+        self.debug_window.bind('<Destroy>', self.on_debug_window_destroyed)
+        self.debug_window.geometry("400x1000" if self.latency else "400x860")
         self.debug_window.configure(bg='#2a2a2a')
         
         # Title
@@ -232,7 +347,32 @@ class JukeboxApp:
             bg='#2a2a2a',
             wraplength=350
         )
-        self.rfid_display.pack(pady=10)
+        self.rfid_display.pack(pady=(10, 0))
+        
+        # RFID reader health
+        self.rfid_health_label = tk.Label(
+            self.debug_window,
+            text="",
+            font=('Helvetica', 9),
+            fg='#aaa',
+            bg='#2a2a2a',
+            wraplength=350
+        )
+        self.rfid_health_label.pack(pady=(0, 10))
+        
+        # Tap-to-audio latency percentiles
+        self.latency_label = None
+        if self.latency:
+            self.latency_label = tk.Label(
+                self.debug_window,
+                text="",
+                font=('Courier', 8),
+                fg='#aaa',
+                bg='#2a2a2a',
+                justify=tk.LEFT
+            )
+            self.latency_label.pack(pady=(0, 10))
+        self.update_rfid_health()
         
         # Configure Stop NFC button
         stop_nfc_btn = tk.Button(
@@ -293,7 +433,74 @@ class JukeboxApp:
             fg='white',
             width=20
         )
-        rescan_btn.pack(pady=10)
+        rescan_btn.pack(pady=(10, 2))
+        
+        # Full rebuild ignores the library index
+        rebuild_btn = tk.Button(
+            self.debug_window,
+            text="Full Rebuild",
+            font=('Helvetica', 10),
+            command=lambda: self.rescan_library(full_rescan=True),
+            bg='#1565C0',
+            fg='white',
+            width=20
+        )
+        rebuild_btn.pack(pady=(0, 10))
+        
+        # Library search
+        tk.Label(
+            self.debug_window,
+            text="Search Library:",
+            font=('Helvetica', 12),
+            fg='white',
+            bg='#2a2a2a'
+        ).pack(pady=(10, 5))
+        
+        self.search_entry = tk.Entry(self.debug_window, width=35, font=('Helvetica', 10))
+        self.search_entry.pack(pady=5)
+        self.search_entry.bind('<KeyRelease>', lambda event: self.schedule_search())
+        
+        self.search_results = tk.Listbox(
+            self.debug_window,
+            width=50,
+            height=6,
+            font=('Helvetica', 9),
+            fg='white',
+            bg='#1a1a1a'
+        )
+        self.search_results.pack(pady=5)
+        
+        # Songs skipped because they failed to load
+        self.quarantine_label = tk.Label(
+            self.debug_window,
+            text="Quarantined Files:",
+            font=('Helvetica', 12),
+            fg='white',
+            bg='#2a2a2a'
+        )
+        self.quarantine_label.pack(pady=(10, 5))
+        
+        self.quarantine_list = tk.Listbox(
+            self.debug_window,
+            width=50,
+            height=4,
+            font=('Helvetica', 9),
+            fg='white',
+            bg='#1a1a1a'
+        )
+        self.quarantine_list.pack(pady=5)
+        
+        clear_quarantine_btn = tk.Button(
+            self.debug_window,
+            text="Clear Quarantine",
+            font=('Helvetica', 10),
+            command=self.clear_quarantine,
+            bg='#555',
+            fg='white',
+            width=20
+        )
+        clear_quarantine_btn.pack(pady=(0, 10))
+        self.refresh_quarantine_list()
         
         # Save button
         save_btn = tk.Button(
@@ -319,6 +526,27 @@ class JukeboxApp:
             width=20
         )
         close_btn.pack(pady=10)
+        
+        self.search_all = True
+        self.update_search_index()
+    
+    def on_debug_window_destroyed(self, event):
+        """Release what the debug window's search held once the window closes"""
+        # <Destroy> is also delivered for each child widget
+        if event.widget is not event.widget.winfo_toplevel():
+            return
+        
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        self.search_all = False
+        
+        def release():
+            # The window may have been opened again in the meantime
+            if not self.search_all:
+                self.music_library.release_search_index()
+        
+        threading.Thread(target=release, daemon=True).start()
     
     def toggle_rfid_read_mode(self):
         """Toggle RFID read mode"""
@@ -326,7 +554,7 @@ class JukeboxApp:
         
         if self.rfid_read_mode:
             # Stop music if playing
-            self.music_player.stop()
+            self.player.stop()
             self.update_display("", "", "")
             logger.info("Entered RFID read mode")
         else:
@@ -346,7 +574,7 @@ class JukeboxApp:
     def configure_stop_nfc(self):
         """Configure stop NFC ID"""
         self.stop_nfc_config_mode = True
-        self.music_player.stop()
+        self.player.stop()
         
         # Update RFID display in debug window to show we're waiting
         if self.debug_window and self.debug_window.winfo_exists():
@@ -375,11 +603,151 @@ class JukeboxApp:
             self.path_entry.delete(0, tk.END)
             self.path_entry.insert(0, path)
     
-    def rescan_library(self):
-        """Rescan music library"""
+    def rescan_library(self, full_rescan=False):
+        """
+        Rescan music library
+        
+        Args:
+            full_rescan: If True, rebuild the library index from scratch
+        """
         logger.info("Rescanning music library...")
-        self.music_library.scan_library()
-        messagebox.showinfo("Library Scan", f"Found {len(self.music_library.playlists)} playlists")
+        self.music_library.scan_library(full_rescan=full_rescan)
+        self.index_metadata()
+        self.update_search_index()
+        messagebox.showinfo("Library Scan", f"Found {len(self.music_library.get_playlist_ids())} playlists")
+    
+    def create_transcode_cache(self) -> Optional[TranscodeCache]:
+        """Create the transcode cache if its encoder is installed"""
+        try:
+            encoder = make_encoder(self.config.get('transcode_encoder', 'ffmpeg-vorbis'))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Invalid transcode encoder: {e}")
+            return None
+        
+        if not encoder.available():
+            logger.warning(f"Transcode encoder {encoder.command[0]} not found, transcoding disabled")
+            return None
+        
+        return TranscodeCache(
+            self.config.get('transcode_cache_path'),
+            self.config.get('transcode_cache_mb', 2048) * 1024 * 1024,
+            encoder,
+            extensions=self.config.get('transcode_extensions', ['.flac', '.m4a']),
+            workers=self.config.get('transcode_workers', 1)
+        )
+    
+    def index_metadata(self, nfc_ids=None):
+        """
+        Read durations, measure loudness and transcode costly formats in the background
+        
+        Args:
+            nfc_ids: Playlists to index (default: all scanned playlists)
+        """
+        library_path = self.music_library.library_path
+        playlists = self.music_library.get_loaded_playlists()
+        
+        # Forget metadata of files that were removed or renamed, so the cache
+        # only holds the library; playlists that are not loaded keep theirs
+        if nfc_ids is None:
+            loaded = {playlist.nfc_id for playlist in playlists}
+            keep = {os.path.join(library_path, nfc_id)
+                    for nfc_id in self.music_library.get_playlist_ids() if nfc_id not in loaded}
+            keep.update(song.path for playlist in playlists for song in playlist.songs)
+            self.metadata.prune(library_path, keep, outside=True)
+        else:
+            playlists = [p for p in playlists if p.nfc_id in nfc_ids]
+            for playlist in playlists:
+                self.metadata.prune(playlist.path, (song.path for song in playlist.songs))
+            current = set(self.music_library.get_playlist_ids())
+            for nfc_id in nfc_ids:
+                if nfc_id not in current:
+                    self.metadata.prune(os.path.join(library_path, nfc_id), ())
+        
+        for playlist in playlists:
+            self.metadata.submit(song.path for song in playlist.songs)
+            if self.transcode_cache:
+                self.transcode_cache.submit(song.path for song in playlist.songs)
+            if self.loudness:
+                self.loudness.submit(song.path for song in playlist.songs)
+    
+    def update_search_index(self):
+        """Build the library search index in the background"""
+        include_unloaded = self.search_all
+        
+        def update():
+            self.music_library.update_search_index(include_unloaded)
+            if include_unloaded:
+                # Show results for text typed while the index was built
+                self.root.after(0, self.search_library)
+        
+        threading.Thread(target=update, daemon=True).start()
+    
+    def start_library_watcher(self):
+        """Start (or restart) watching the music library for changes"""
+        if self.library_watcher:
+            self.library_watcher.stop()
+        
+        self.library_watcher = LibraryWatcher(
+            self.music_library,
+            on_change=lambda nfc_ids: self.root.after(0, lambda: self.on_library_change(nfc_ids)),
+            poll_interval=self.config.get('library_watch_poll_interval', 10)
+        )
+        self.library_watcher.start()
+    
+    def on_library_change(self, nfc_ids):
+        """Callback when the library watcher updated playlists"""
+        self.index_metadata(nfc_ids)
+        self.update_search_index()
+        
+        # Decoded tracks may be stale if their files were replaced
+        if self.sound_cache:
+            self.sound_cache.clear()
+        
+        if not self.current_playlist or self.current_playlist.nfc_id not in nfc_ids:
+            return
+        
+        # Patch the playing playlist in place so the current track keeps playing
+        songs = self.music_library.get_all_songs(self.current_playlist.nfc_id)
+        if songs:
+            self.player.update_playlist(songs)
+    
+    def refresh_quarantine_list(self):
+        """Show quarantined songs in the debug window"""
+        entries = self.quarantine.get_entries()
+        self.quarantine_label.config(text=f"Quarantined Files: {len(entries)}")
+        self.quarantine_list.delete(0, tk.END)
+        
+        for path, reason in entries:
+            self.quarantine_list.insert(tk.END, f"{os.path.basename(path)}: {reason}")
+    
+    def clear_quarantine(self):
+        """Release all quarantined songs so they are tried again"""
+        self.quarantine.clear()
+        self.refresh_quarantine_list()
+        logger.info("Quarantine cleared")
+    
+    def schedule_search(self):
+        """Search once typing pauses instead of on every keystroke"""
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(250, self.search_library)
+    
+    def search_library(self):
+        """Show library search results in the debug window"""
+        self.search_job = None
+        if not (self.debug_window and self.debug_window.winfo_exists()):
+            return
+        
+        query = self.search_entry.get()
+        self.search_results.delete(0, tk.END)
+        
+        for nfc_id, artist, album, song in self.music_library.search(query, limit=100):
+            parts = [artist.name]
+            if album:
+                parts.append(album.name)
+            if song:
+                parts.append(song.name)
+            self.search_results.insert(tk.END, f"{nfc_id}: {' / '.join(parts)}")
     
     def save_configuration(self):
         """Save configuration"""
@@ -389,6 +757,8 @@ class JukeboxApp:
             self.config.set_music_library_path(new_path)
             self.music_library.library_path = new_path
             self.rescan_library()
+            if self.library_watcher:
+                self.start_library_watcher()
         
         # Save config
         if self.config.save():
@@ -396,23 +766,70 @@ class JukeboxApp:
         else:
             messagebox.showerror("Error", "Failed to save configuration")
     
-    def poll_rfid(self):
-        """Poll RFID reader for new tags"""
-        def read_rfid():
-            nfc_id = self.rfid_reader.read_id()
-            
-            if nfc_id:
-                self.root.after(0, lambda: self.handle_nfc_tag(nfc_id))
+    def process_rfid_events(self):
+        """Handle tag arrivals and removals queued by the RFID reader thread"""
+        for event in self.rfid_reader.get_events():
+            if event.kind == TAG_REMOVED:
+                self.handle_tag_removed(event.tag_id)
+            elif event.tag_id == self.paused_tag:
+                logger.info(f"NFC tag returned: {event.tag_id}")
+                self.paused_tag = None
+                self.player.unpause()
+            else:
+                self.paused_tag = None
+                if self.latency:
+                    started = time.monotonic()
+                    self.latency.record('dispatch', started - event.read_at)
+                    self.handle_nfc_tag(event.tag_id, event.read_at)
+                    self.latency.record('handle_nfc_tag', time.monotonic() - started)
+                else:
+                    self.handle_nfc_tag(event.tag_id)
         
-        # Run in separate thread to avoid blocking UI
-        thread = threading.Thread(target=read_rfid, daemon=True)
-        thread.start()
+        if self.debug_window and self.debug_window.winfo_exists():
+            self.update_rfid_health()
+    
+    def handle_tag_removed(self, nfc_id: str):
+        """Pause the tag's playlist when it is lifted off the reader, if configured"""
+        if not self.config.get('pause_on_tag_removal', False):
+            return
+        if not self.current_playlist or self.current_playlist.nfc_id != nfc_id:
+            return
+        if not self.player.get_state().playing:
+            return
         
-        # Poll every 500ms
-        self.root.after(500, self.poll_rfid)
+        logger.info(f"NFC tag removed, pausing: {nfc_id}")
+        self.record_resume_position()
+        self.player.pause()
+        self.paused_tag = nfc_id
     
-    def handle_nfc_tag(self, nfc_id: str):
-        """Handle NFC tag detection"""
+    def update_rfid_health(self):
+        """Show RFID reader health and tap latency in the debug window, refreshed while it is open"""
+        if not (self.debug_window and self.debug_window.winfo_exists()):
+            self.rfid_health_job = None
+            return
+        if self.rfid_health_job:
+            self.root.after_cancel(self.rfid_health_job)
+        self.rfid_health_job = self.root.after(5000, self.update_rfid_health)
+        
+        health = self.rfid_reader.get_health()
+        text = (f"Reader: {health['reads']} reads, {health['read_errors']} errors, "
+                f"{health['wakeups_per_minute']} wakeups/min")
+        if health['consecutive_errors']:
+            text += f" ({health['consecutive_errors']} in a row: {health['last_error']})"
+        self.rfid_health_label.config(text=text)
+        
+        if self.latency_label:
+            lines = self.latency.format_lines()
+            self.latency_label.config(text='\n'.join(lines) if lines else "No taps timed yet")
+    
+    def handle_nfc_tag(self, nfc_id: str, tapped_at: Optional[float] = None):
+        """
+        Handle NFC tag detection
+        
+        Args:
+            nfc_id: NFC tag ID
+            tapped_at: Monotonic time the tag was read, for latency tracking
+        """
         logger.info(f"NFC tag detected: {nfc_id}")
         
         # If in stop NFC config mode
@@ -457,22 +874,37 @@ class JukeboxApp:
         # Check if it's the stop command
         if self.config.is_stop_nfc(nfc_id):
             logger.info("Stop NFC detected")
-            self.music_player.stop()
+            self.record_resume_position()
+            self.player.stop()
             self.update_display("Music Stopped", "", "")
             self.display_album_art(None)
             return
         
         # Load and play playlist
-        playlist = self.music_library.get_playlist(nfc_id)
+        lookup_started = time.monotonic() if self.latency else None
+        playlist, scanned = self.music_library.fetch_playlist(nfc_id)
         
         if playlist:
             logger.info(f"Loading playlist for NFC ID: {nfc_id}")
             songs = self.music_library.get_all_songs(nfc_id)
+            if self.latency:
+                self.latency.record('library_lookup', time.monotonic() - lookup_started)
             
             if songs:
+                self.record_resume_position()
+                start_index, start_position = self.get_resume_point(nfc_id, songs)
+                if start_index or start_position:
+                    logger.info(f"Resuming at track {start_index + 1}, {start_position:.0f}s")
+                
                 self.current_playlist = playlist
-                self.music_player.load_playlist(songs)
-                self.music_player.play(0)
+                self.player.load_playlist(songs, start_index, start_position, tapped_at)
+                
+                # Lazily loaded playlists are indexed when they are scanned
+                if scanned:
+                    self.index_metadata([nfc_id])
+                total = self.metadata.get_total_duration(song.path for song in songs)
+                if total:
+                    logger.info(f"Playlist length: {int(total // 60)}:{int(total % 60):02d}")
             else:
                 logger.warning(f"No songs found in playlist: {nfc_id}")
                 self.update_display("No Songs Found", "", "")
@@ -480,6 +912,69 @@ class JukeboxApp:
             logger.warning(f"No playlist found for NFC ID: {nfc_id}")
             self.update_display("Unknown NFC Tag", f"ID: {nfc_id}", "")
     
+    def get_resume_point(self, nfc_id: str, songs) -> tuple:
+        """
+        Get the track index and position a tag was left at
+        
+        Args:
+            nfc_id: NFC tag ID
+            songs: Current songs of the tag's playlist
+        
+        Returns:
+            tuple: (track index, position in seconds), (0, 0.0) to start over
+        """
+        if not self.resume_journal:
+            return 0, 0.0
+        
+        state = self.resume_journal.get(nfc_id)
+        if not state:
+            return 0, 0.0
+        
+        index, position, path = state
+        if index < len(songs) and songs[index].path == path:
+            return index, position
+        
+        # Songs were added or removed since; follow the track by path
+        for i, song in enumerate(songs):
+            if song.path == path:
+                return i, position
+        return 0, 0.0
+    
+    def record_resume_position(self):
+        """Record the track and position of the playing tag in the resume journal"""
+        if not self.resume_journal or not self.current_playlist:
+            return
+        
+        # Only the audio thread touches the player; its snapshot keeps the
+        # index and position of one song together across track changes
+        state = self.player.get_state()
+        
+        # The player may not have switched to the tapped playlist yet
+        if state.songs is not self.current_playlist.songs or state.path is None:
+            return
+        
+        self.resume_journal.record(
+            self.current_playlist.nfc_id,
+            state.index,
+            state.position,
+            state.path
+        )
+    
+    def track_resume_position(self):
+        """Periodically record the playback position"""
+        if self.player.get_state().playing:
+            self.record_resume_position()
+        
+        self.root.after(
+            int(self.config.get('resume_save_interval', 5) * 1000),
+            self.track_resume_position
+        )
+    
+    def log_latency(self):
+        """Periodically log tap latency percentiles"""
+        self.latency.log_summary()
+        self.root.after(int(self.config.get('latency_log_interval', 60) * 1000), self.log_latency)
+    
     def on_song_change(self, song: Song, index: int):
         """Callback when song changes"""
         if not self.current_playlist:
@@ -496,7 +991,10 @@ class JukeboxApp:
         )
         
         # Update album art
+        art_started = time.monotonic() if self.latency else None
         self.display_album_art(info['album_art'])
+        if self.latency:
+            self.latency.record('album_art', time.monotonic() - art_started)
         
         logger.info(f"Now playing: {info['artist']} - {info['song']}")
     
@@ -545,19 +1043,26 @@ class JukeboxApp:
             # Show solid color as last resort
             self.album_art_label.config(bg='#1a1a1a')
     
-    def check_pygame_events(self):
-        """Check for pygame events (song end)"""
-        for event in pygame.event.get():
-            if event.type == self.music_player.SONG_END:
-                self.music_player.handle_song_end()
-        
-        # Check every 100ms
-        self.root.after(100, self.check_pygame_events)
-    
     def cleanup(self):
         """Clean up resources"""
         logger.info("Cleaning up...")
-        self.music_player.stop()
+        # No new tags while shutting down
+        self.rfid_reader.stop()
+        self.record_resume_position()
+        self.player.stop()
+        self.player.shutdown()
+        if self.resume_journal:
+            self.resume_journal.close()
+        if self.library_watcher:
+            self.library_watcher.stop()
+        self.metadata.shutdown()
+        if self.transcode_cache:
+            self.transcode_cache.shutdown()
+        if self.loudness:
+            self.loudness.shutdown()
+        if self.staging_cache:
+            self.staging_cache.close()
+        self.music_library.save_index()
         self.rfid_reader.cleanup()
         pygame.quit()
 
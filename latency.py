@@ -0,0 +1,110 @@
+"""
+Latency
+Rolling percentiles of how long each stage between a tag tap and sound takes
+"""
+import math
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stages in pipeline order, for display
+STAGES = [
+    'rfid_read',        # Chip commands of the read that found the tag
+    'dispatch',         # Read returning until the UI thread handles the event
+    'handle_nfc_tag',   # Whole tag handler on the UI thread
+    'library_lookup',   # get_playlist and get_all_songs
+    'player_queue',     # Handler submitting until the audio thread starts the command
+    'load_playlist',    # MusicPlayer.load_playlist
+    'mixer_load',       # Loading or decoding the first song
+    'mixer_play',       # Starting the mixer
+    'album_art',        # display_album_art
+    'tap_to_audio',     # Read returning until the mixer plays
+]
+
+
+class LatencyTracker:
+    """Keeps the latest durations per stage and reports their percentiles"""
+
+    def __init__(self, window: int = 500):
+        """
+        Initialize latency tracker
+
+        Components only hold a tracker when tracking is enabled, so disabled
+        tracking costs a None check per stage.
+
+        Args:
+            window: Durations kept per stage; older ones are dropped
+        """
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """
+        Record how long a stage took
+
+        Args:
+            stage: Stage name, see STAGES
+            seconds: Duration in seconds
+        """
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def get_percentiles(self) -> Dict[str, dict]:
+        """
+        Get percentiles of the recorded durations
+
+        Returns:
+            dict: Stage -> {'count', 'p50', 'p95', 'p99'} in milliseconds
+        """
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self._samples.items()}
+
+        result = {}
+        for stage, values in snapshot.items():
+            if not values:
+                continue
+            result[stage] = {
+                'count': len(values),
+                'p50': _percentile(values, 50) * 1000,
+                'p95': _percentile(values, 95) * 1000,
+                'p99': _percentile(values, 99) * 1000
+            }
+        return result
+
+    def format_lines(self) -> List[str]:
+        """Format the percentiles as one line per stage, in pipeline order"""
+        percentiles = self.get_percentiles()
+        order = STAGES + sorted(set(percentiles) - set(STAGES))
+        return [
+            f"{stage}: p50 {p['p50']:.1f} / p95 {p['p95']:.1f} / p99 {p['p99']:.1f} ms (n={p['count']})"
+            for stage, p in ((stage, percentiles.get(stage)) for stage in order) if p
+        ]
+
+    def log_summary(self):
+        """Log the percentiles in one line"""
+        percentiles = self.get_percentiles()
+        if not percentiles:
+            return
+        parts = [f"{stage} {p['p50']:.1f}/{p['p95']:.1f}/{p['p99']:.1f}"
+                 for stage, p in ((stage, percentiles.get(stage)) for stage in STAGES) if p]
+        logger.info(f"Latency p50/p95/p99 ms: {', '.join(parts)}")
+
+    def clear(self):
+        """Forget all recorded durations"""
+        with self._lock:
+            self._samples = {}
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[rank]
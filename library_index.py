@@ -0,0 +1,200 @@
+"""
+Library Index
+Persistent snapshot of the music library directory tree used for incremental rescans
+"""
+import json
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+
+# A listing taken this soon after its directory's mtime is not trusted, since
+# a change in the same clock tick would not bump the mtime (FAT on SD cards
+# and USB sticks only has 2 second resolution).
+MTIME_GRACE_NS = 2 * 1000 * 1000 * 1000
+
+
+class LibraryIndex:
+    """Caches directory listings of the music library keyed by directory mtime"""
+
+    def __init__(self, index_path: Optional[str], library_path: str):
+        """
+        Initialize library index
+
+        Args:
+            index_path: Path of the on-disk index file, or None to keep it in memory only
+            library_path: Root path of the music library the index describes
+        """
+        self.index_path = index_path
+        self.library_path = library_path
+
+        # Relative directory path -> [mtime_ns, subdirectories, files, listed_at_ns]
+        self.entries: Dict[str, list] = {}
+
+        # Listings that may be reused; outside of a scan this is self.entries
+        self._previous: Dict[str, list] = self.entries
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.listed = 0
+
+        self.load()
+
+    def load(self):
+        """Load index from file"""
+        if not self.index_path:
+            return
+
+        if not os.path.exists(self.index_path):
+            logger.info("No library index found, first scan will be a full scan")
+            return
+
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+
+            if data.get('version') != INDEX_VERSION:
+                logger.info("Library index version changed, ignoring old index")
+                return
+
+            if data.get('library_path') != os.path.abspath(self.library_path):
+                logger.info("Library index belongs to another library path, ignoring it")
+                return
+
+            self.entries = data.get('entries', {})
+            self._previous = self.entries
+            logger.info(f"Library index loaded with {len(self.entries)} directories")
+        except Exception as e:
+            logger.error(f"Error loading library index: {e}")
+            self.entries = {}
+            self._previous = self.entries
+
+    def save(self) -> bool:
+        """Save index to file atomically"""
+        if not self.index_path:
+            return True
+
+        # Between begin_scan() and end_scan() (as in lazy mode) directories not
+        # visited yet keep their entries from the previous scan
+        with self._lock:
+            entries = self.entries
+            if self._previous is not self.entries:
+                entries = dict(self._previous)
+                entries.update(self.entries)
+
+            data = {
+                'version': INDEX_VERSION,
+                'library_path': os.path.abspath(self.library_path),
+                'entries': entries
+            }
+            tmp_path = self.index_path + '.tmp'
+
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.index_path)
+                logger.info(f"Library index saved to {self.index_path}")
+                return True
+            except Exception as e:
+                logger.error(f"Error saving library index: {e}")
+                return False
+
+    def begin_scan(self, full_rescan: bool = False):
+        """
+        Start a new scan generation
+
+        Args:
+            full_rescan: If True, ignore cached listings and list every directory
+        """
+        with self._lock:
+            self._previous = {} if full_rescan else self.entries
+            self.entries = {}
+            self.reused = 0
+            self.listed = 0
+
+    def end_scan(self) -> bool:
+        """Finish the current scan generation and persist it"""
+        with self._lock:
+            self._previous = self.entries
+        logger.info(
+            f"Library index: reused {self.reused} directory listings, "
+            f"listed {self.listed} changed directories"
+        )
+        return self.save()
+
+    def invalidate(self, path: str):
+        """
+        Forget the cached listing of a directory so it is read again
+
+        Args:
+            path: Directory path inside the library
+        """
+        key = os.path.relpath(path, self.library_path)
+        with self._lock:
+            self.entries.pop(key, None)
+            self._previous.pop(key, None)
+
+    def list_dir(self, path: str) -> Tuple[List[str], List[str]]:
+        """
+        List a directory, reusing the cached listing if its mtime is unchanged
+
+        Args:
+            path: Directory path inside the library
+
+        Returns:
+            tuple: Sorted lists of (subdirectory names, file names)
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        key = os.path.relpath(path, self.library_path)
+
+        cached = self._previous.get(key)
+        reuse = cached and cached[0] == mtime_ns and self._is_trusted(cached)
+        if reuse:
+            entry = cached
+        else:
+            listed_at_ns = time.time_ns()
+            dirs, files = self._read_dir(path)
+            entry = [mtime_ns, dirs, files, listed_at_ns]
+
+        # Playlists are scanned from several threads at once
+        with self._lock:
+            if reuse:
+                self.reused += 1
+            else:
+                self.listed += 1
+            self.entries[key] = entry
+
+        return entry[1], entry[2]
+
+    @staticmethod
+    def _is_trusted(entry: list) -> bool:
+        """Check that a listing was taken long enough after its mtime to be reliable"""
+        return entry[0] < entry[3] - MTIME_GRACE_NS
+
+    @staticmethod
+    def _read_dir(path: str) -> Tuple[List[str], List[str]]:
+        """
+        Read a directory listing from disk
+
+        Uses os.scandir so the entry type comes from the directory read itself
+        (d_type) instead of an extra stat call per entry.
+        """
+        dirs = []
+        files = []
+
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+
+        dirs.sort()
+        files.sort()
+        return dirs, files
@@ -0,0 +1,149 @@
+"""
+Library Search
+Tokenised, prefix-capable inverted index over artist, album and song names
+"""
+import re
+import bisect
+import logging
+import threading
+from array import array
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchSegment:
+    """Inverted index over the names in one playlist"""
+
+    def __init__(self, playlist):
+        """
+        Build the index for a playlist
+
+        Args:
+            playlist: Playlist to index
+        """
+        self.nfc_id = playlist.nfc_id
+        # Identity of the play order list tells when the playlist was rescanned
+        self.songs = playlist.songs
+
+        # Matched objects are referenced directly; postings hold their positions
+        self.items: List[object] = []
+        postings: Dict[str, array] = {}
+
+        def add(item, name):
+            item_id = len(self.items)
+            self.items.append(item)
+            for token in set(tokenize(name)):
+                ids = postings.get(token)
+                if ids is None:
+                    ids = postings[token] = array('I')
+                ids.append(item_id)
+
+        for artist in playlist.artists:
+            add(artist, artist.name)
+            for album in artist.albums:
+                add(album, album.name)
+                for song in album.songs:
+                    add(song, song.name)
+
+        self.postings = postings
+        self.tokens = sorted(postings)
+
+    def match(self, prefix: str) -> set:
+        """Get ids of items with a token starting with prefix"""
+        ids = set()
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            ids.update(self.postings[self.tokens[i]])
+            i += 1
+        return ids
+
+
+class SearchIndex:
+    """Search index over all playlists held by a MusicLibrary"""
+
+    def __init__(self):
+        """Initialize search index"""
+        self.segments: Dict[str, SearchSegment] = {}
+        self._lock = threading.Lock()
+
+    def update(self, playlists):
+        """
+        Bring the index in line with the given playlists
+
+        Only playlists that are new or were rescanned since the last update
+        are indexed again.
+
+        Args:
+            playlists: Playlists currently held by the library
+        """
+        current = {playlist.nfc_id: playlist for playlist in playlists}
+
+        with self._lock:
+            for nfc_id in [n for n in self.segments if n not in current]:
+                del self.segments[nfc_id]
+
+            rebuilt = 0
+            for nfc_id, playlist in current.items():
+                segment = self.segments.get(nfc_id)
+                if segment is None or segment.songs is not playlist.songs:
+                    self.segments[nfc_id] = SearchSegment(playlist)
+                    rebuilt += 1
+
+        if rebuilt:
+            logger.info(f"Search index updated for {rebuilt} playlists")
+
+    def search(self, query: str, limit: int = 50) -> List[tuple]:
+        """
+        Find artists, albums and songs whose names match every query token
+
+        Each query token matches name tokens it is a prefix of, so partial
+        words work as the operator types.
+
+        Args:
+            query: Search text
+            limit: Maximum number of results
+
+        Returns:
+            list: (nfc_id, Artist, Album or None, Song or None) tuples
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        # Longest tokens are the most selective, so intersect from those
+        query_tokens.sort(key=len, reverse=True)
+        results = []
+
+        with self._lock:
+            segments = [self.segments[nfc_id] for nfc_id in sorted(self.segments)]
+
+        for segment in segments:
+            ids = segment.match(query_tokens[0])
+            for token in query_tokens[1:]:
+                if not ids:
+                    break
+                ids &= segment.match(token)
+
+            for item_id in sorted(ids):
+                results.append(self._describe(segment.nfc_id, segment.items[item_id]))
+                if len(results) >= limit:
+                    return results
+
+        return results
+
+    @staticmethod
+    def _describe(nfc_id: str, item) -> tuple:
+        """Expand a matched object into (nfc_id, artist, album, song)"""
+        if hasattr(item, 'albums'):
+            return nfc_id, item, None, None
+        if hasattr(item, 'songs'):
+            return nfc_id, item.artist, item, None
+        return nfc_id, item.album.artist, item.album, item
@@ -0,0 +1,392 @@
+"""
+Library Watcher
+Watches the music library for changes and applies targeted updates to the library
+"""
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (see inotify(7))
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Library layout: <root>/<nfc_id>/<artist>/<album>/<song>
+MAX_DEPTH = 3
+
+
+class InotifyBackend:
+    """Reports changed directories using Linux inotify"""
+
+    def __init__(self, root: str):
+        """
+        Initialize inotify backend
+
+        Args:
+            root: Root directory of the music library
+
+        Raises:
+            OSError: If inotify is not available or a watch cannot be added
+        """
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify not supported on this platform")
+
+        self.root = root
+        self._watches: Dict[int, str] = {}
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Self-pipe in the select set, so wake() interrupts a wait
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        # wake() may race with close() from the watcher thread
+        self._fd_lock = threading.Lock()
+
+        try:
+            self.sync(root)
+        except OSError:
+            self.close()
+            raise
+
+    def sync(self, path: str):
+        """Add watches for a directory and its subdirectories within the library depth"""
+        depth = _depth(self.root, path)
+        if depth > MAX_DEPTH or not os.path.isdir(path):
+            return
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOENT:
+                return
+            # ENOSPC means fs.inotify.max_user_watches is exhausted
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self._watches[wd] = path
+
+        if depth < MAX_DEPTH:
+            try:
+                with os.scandir(path) as it:
+                    subdirs = [entry.path for entry in it if entry.is_dir()]
+            except OSError:
+                return
+            for subdir in subdirs:
+                self.sync(subdir)
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """
+        Wait for events
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            set: Directories whose entries changed, or None if a full rescan is needed
+        """
+        readable, _, _ = select.select([self._fd, self._wake_read], [], [], timeout)
+        if self._wake_read in readable:
+            try:
+                os.read(self._wake_read, 64)
+            except BlockingIOError:
+                pass
+            return set()
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+
+            path = self._watches.get(wd)
+            if path is None:
+                continue
+
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(os.path.dirname(path))
+                continue
+
+            changed.add(path)
+            if name and mask & (IN_CREATE | IN_MOVED_TO):
+                # New directories need their own watches
+                self.sync(os.path.join(path, os.fsdecode(name)))
+
+        return changed
+
+    def wake(self):
+        """Make a wait in another thread return now"""
+        with self._fd_lock:
+            if self._fd < 0:
+                return
+            try:
+                os.write(self._wake_write, b'\0')
+            except BlockingIOError:
+                # A full pipe wakes the waiter already
+                pass
+
+    def close(self):
+        """Release the inotify and wake file descriptors"""
+        with self._fd_lock:
+            if self._fd >= 0:
+                os.close(self._fd)
+                os.close(self._wake_read)
+                os.close(self._wake_write)
+                self._fd = -1
+
+
+class PollingBackend:
+    """Reports changed directories by periodically comparing directory mtimes"""
+
+    def __init__(self, root: str, interval: float = 5.0):
+        """
+        Initialize polling backend
+
+        Args:
+            root: Root directory of the music library
+            interval: Seconds between polls
+        """
+        self.root = root
+        self.interval = interval
+        self._mtimes: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self.sync(root)
+        self._next_poll = time.monotonic() + interval
+
+    def sync(self, path: str):
+        """Record mtimes for a directory and its subdirectories within the library depth"""
+        self._poll_dir(path, set())
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """
+        Wait for the next poll and compare mtimes
+
+        The tree is only polled once the interval has passed since the last
+        poll; shorter timeouts (e.g. the watcher's debounce) just wait.
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            set: Directories whose entries changed, empty if no poll was due
+        """
+        remaining = self._next_poll - time.monotonic()
+        if self._stop.wait(max(0.0, min(timeout, remaining))) or timeout < remaining:
+            return set()
+
+        changed = set()
+        for path in list(self._mtimes):
+            if path in self._mtimes:
+                self._poll_dir(path, changed)
+        self._next_poll = time.monotonic() + self.interval
+        return changed
+
+    def wake(self):
+        """Make a wait in another thread return now"""
+        self._stop.set()
+
+    def close(self):
+        """Stop waiting"""
+        self._stop.set()
+
+    def _poll_dir(self, path: str, changed: Set[str]):
+        """Stat a directory, descending into it only if its mtime changed"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            # Removed; the parent directory's mtime changes as well
+            for known in [p for p in self._mtimes if p == path or p.startswith(path + os.sep)]:
+                del self._mtimes[known]
+            return
+
+        if self._mtimes.get(path) == mtime_ns:
+            return
+
+        if path in self._mtimes:
+            changed.add(path)
+        self._mtimes[path] = mtime_ns
+
+        if _depth(self.root, path) < MAX_DEPTH:
+            try:
+                with os.scandir(path) as it:
+                    subdirs = [entry.path for entry in it if entry.is_dir()]
+            except OSError:
+                return
+            for subdir in subdirs:
+                if subdir not in self._mtimes:
+                    self._poll_dir(subdir, changed)
+
+
+class LibraryWatcher:
+    """Turns filesystem changes into coalesced, targeted library updates"""
+
+    def __init__(self, music_library, on_change: Optional[Callable[[List[str]], None]] = None,
+                 debounce: float = 2.0, max_delay: float = 30.0, poll_interval: float = 5.0,
+                 use_inotify: bool = True):
+        """
+        Initialize library watcher
+
+        Args:
+            music_library: MusicLibrary to keep up to date
+            on_change: Called from the watcher thread with the NFC IDs that changed
+            debounce: Seconds without new events before a burst is applied
+            max_delay: Upper bound on how long a continuous burst is held back
+            poll_interval: Seconds between polls when inotify is unavailable
+            use_inotify: If False, always use the polling backend
+        """
+        self.music_library = music_library
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        """Start watching the library in a background thread"""
+        if self._running:
+            return
+
+        root = os.path.abspath(self.music_library.library_path)
+        self.backend = None
+        if self.use_inotify:
+            try:
+                self.backend = InotifyBackend(root)
+                logger.info("Library watcher using inotify")
+            except Exception as e:
+                logger.warning(f"inotify unavailable ({e}), falling back to polling")
+
+        if self.backend is None:
+            self.backend = PollingBackend(root, self.poll_interval)
+            logger.info(f"Library watcher polling every {self.poll_interval}s")
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(self.backend,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching the library
+
+        The watcher thread owns its backend and closes it on exit, so a thread
+        still busy applying changes after the join timeout never has its
+        backend closed underneath it.
+        """
+        self._running = False
+        backend = self.backend
+        self.backend = None
+        if backend:
+            backend.wake()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            if self._thread.is_alive():
+                logger.warning("Library watcher thread still busy, it will stop when done")
+            self._thread = None
+
+    def _run(self, backend):
+        """Collect changed directories and apply them once a burst settles"""
+        try:
+            self._watch(backend)
+        finally:
+            backend.close()
+
+    def _watch(self, backend):
+        """Wait on a backend until the watcher is stopped or restarted with another one"""
+        pending: Set[str] = set()
+        first_event = last_event = 0.0
+
+        while self._running and self.backend is backend:
+            timeout = self.debounce if pending else 1.0
+            try:
+                changed = backend.wait(timeout)
+            except Exception as e:
+                logger.error(f"Library watcher error: {e}")
+                time.sleep(timeout)
+                continue
+
+            now = time.monotonic()
+            if changed is None:
+                # Event queue overflowed, treat the whole library as changed
+                changed = {backend.root}
+                changed.update(
+                    os.path.join(backend.root, nfc_id)
+                    for nfc_id in self.music_library.get_playlist_ids()
+                )
+
+            if changed:
+                if not pending:
+                    first_event = now
+                pending.update(changed)
+                last_event = now
+
+            if pending and (now - last_event >= self.debounce or
+                            now - first_event >= self.max_delay):
+                self._apply(pending)
+                pending = set()
+
+    def _apply(self, paths: Set[str]):
+        """Apply a batch of changed directories to the library"""
+        logger.info(f"Library watcher: applying changes in {len(paths)} directories")
+        try:
+            changed = self.music_library.refresh_paths(paths)
+        except Exception as e:
+            logger.error(f"Error updating music library: {e}")
+            return
+
+        if changed and self.on_change:
+            try:
+                self.on_change(changed)
+            except Exception as e:
+                logger.error(f"Error in library change callback: {e}")
+
+
+def _depth(root: str, path: str) -> int:
+    """Number of path components of path below root"""
+    rel_path = os.path.relpath(path, root)
+    if rel_path == os.curdir:
+        return 0
+    return rel_path.count(os.sep) + 1
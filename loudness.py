@@ -0,0 +1,336 @@
+"""
+Loudness
+Measures track and album loudness in the background for volume normalisation
+"""
+import os
+import json
+import math
+import wave
+import shutil
+import logging
+import threading
+import subprocess
+from typing import Dict, Iterable, Iterator, Optional
+
+from job_runner import ProcessJobRunner
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+CACHE_VERSION = 1
+
+# Decoding at a low rate keeps analysis cheap; loudness barely depends on it
+ANALYSIS_RATE = 22050
+BLOCK_SECONDS = 0.05
+# Blocks quieter than this (-70 dBFS) are silence and don't count
+SILENCE_POWER = 1e-7
+# ReplayGain-style: loudness is the 95th percentile of block power
+LOUDNESS_PERCENTILE = 95
+# Frames decoded at a time; bounds memory however long a track is
+CHUNK_FRAMES = ANALYSIS_RATE * 10
+# Without ffmpeg, compressed files are decoded whole by pygame; larger ones are skipped
+MAX_FULL_DECODE_BYTES = 8 * 1024 * 1024
+
+
+def _init_worker():
+    """Set up a pool process to decode audio without a sound device"""
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    import pygame
+    pygame.mixer.init(frequency=ANALYSIS_RATE, size=-16, channels=2)
+
+
+def _wav_chunks(path: str) -> Iterator[tuple]:
+    """Read a 8 or 16-bit WAV file in chunks of frames x channels"""
+    with wave.open(path, 'rb') as f:
+        width = f.getsampwidth()
+        if width not in (1, 2):
+            raise ValueError(f"unsupported WAV sample width: {width}")
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        while True:
+            data = f.readframes(CHUNK_FRAMES)
+            if not data:
+                return
+            if width == 1:
+                samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+            else:
+                samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+            yield samples.reshape(-1, channels), rate
+
+
+def _ffmpeg_chunks(path: str) -> Iterator[tuple]:
+    """Decode a file with ffmpeg and read the PCM stream in chunks"""
+    args = ['ffmpeg', '-nostdin', '-v', 'error', '-i', path, '-vn', '-f', 's16le',
+            '-acodec', 'pcm_s16le', '-ac', '2', '-ar', str(ANALYSIS_RATE), '-']
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    complete = False
+    try:
+        while True:
+            data = process.stdout.read(CHUNK_FRAMES * 4)
+            if not data:
+                break
+            # A read can end mid-frame
+            data = data[:len(data) - len(data) % 4]
+            samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+            yield samples.reshape(-1, 2), ANALYSIS_RATE
+        complete = True
+    finally:
+        process.stdout.close()
+        # Only a consumer that stopped early or failed leaves ffmpeg running
+        if not complete:
+            process.kill()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}")
+
+
+def _pygame_chunks(path: str) -> Iterator[tuple]:
+    """Decode a small file whole with pygame and convert it in chunks"""
+    if os.path.getsize(path) > MAX_FULL_DECODE_BYTES:
+        raise ValueError("file too large to decode without ffmpeg")
+
+    import pygame
+    sound = pygame.mixer.Sound(path)
+    samples = pygame.sndarray.array(sound)
+    del sound
+
+    rate, size, _ = pygame.mixer.get_init()
+    scale = float(2 ** (abs(size) - 1))
+    samples = samples.reshape(len(samples), -1)
+    for start in range(0, len(samples), CHUNK_FRAMES):
+        yield samples[start:start + CHUNK_FRAMES].astype(np.float32) / scale, rate
+
+
+def _pcm_chunks(path: str) -> Iterator[tuple]:
+    """Decode a file as (float samples of frames x channels, sample rate) chunks"""
+    if path.lower().endswith('.wav'):
+        try:
+            # Checked here so unsupported WAV files can fall through
+            with wave.open(path, 'rb') as f:
+                supported = f.getsampwidth() in (1, 2)
+        except (wave.Error, EOFError):
+            supported = False
+        if supported:
+            return _wav_chunks(path)
+    if shutil.which('ffmpeg'):
+        return _ffmpeg_chunks(path)
+    return _pygame_chunks(path)
+
+
+def analyze_file(path: str) -> Optional[list]:
+    """
+    Decode a file and measure its loudness
+
+    Runs in a pool process. The file is decoded in chunks so memory stays
+    bounded for long tracks.
+
+    Returns:
+        list: [loudness in dBFS, peak (0.0 to 1.0), duration in seconds],
+            or None if the file is silent
+    """
+    block_powers = []
+    peak = 0.0
+    frames = 0
+    rate = ANALYSIS_RATE
+    # Frames of the last chunk that did not fill a whole block
+    carry = np.zeros(0, dtype=np.float32)
+
+    for samples, rate in _pcm_chunks(path):
+        if samples.size:
+            peak = max(peak, float(np.abs(samples).max()))
+        frames += len(samples)
+        power = np.concatenate((carry, np.mean(samples * samples, axis=1)))
+
+        block = int(rate * BLOCK_SECONDS)
+        blocks = len(power) // block
+        block_powers.append(power[:blocks * block].reshape(blocks, block).mean(axis=1))
+        carry = power[blocks * block:]
+
+    duration = frames / rate
+    if not block_powers:
+        return None
+
+    block_power = np.concatenate(block_powers)
+    block_power = block_power[block_power > SILENCE_POWER]
+    if block_power.size == 0:
+        return None
+
+    loudness = 10 * math.log10(float(np.percentile(block_power, LOUDNESS_PERCENTILE)))
+    return [round(loudness, 2), round(peak, 4), round(duration, 2)]
+
+
+class LoudnessAnalyzer:
+    """Incremental, cached loudness analysis on a background process pool"""
+
+    def __init__(self, cache_path: Optional[str] = None, workers: int = 1,
+                 target_db: float = -18.0):
+        """
+        Initialize loudness analyzer
+
+        Args:
+            cache_path: Path of the cache file, or None to keep it in memory only
+            workers: Number of analysis processes
+            target_db: Loudness every track or album is adjusted to, in dBFS
+        """
+        self.cache_path = cache_path
+        self.workers = max(1, workers)
+        self.target_db = target_db
+
+        # Path -> [size, mtime_ns, loudness_db, peak, duration]; loudness None if unmeasurable
+        self.entries: Dict[str, list] = {}
+        # Album directory -> {path: (loudness_db, duration)} of its measured tracks
+        self._album_tracks: Dict[str, Dict[str, tuple]] = {}
+        # Album directory -> loudness in dBFS, computed on first use
+        self._albums: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._runner = ProcessJobRunner('Loudness', self.workers, self._finished, self._idle,
+                                        initializer=_init_worker)
+        self._dirty = False
+
+        self.load()
+
+    def load(self):
+        """Load cache from file"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.entries = data.get('entries', {})
+                for path, entry in self.entries.items():
+                    self._index_track(path, entry)
+                logger.info(f"Loudness cache loaded with {len(self.entries)} entries")
+        except Exception as e:
+            logger.error(f"Error loading loudness cache: {e}")
+
+    def save(self) -> bool:
+        """Save cache to file atomically"""
+        if not self.cache_path:
+            return True
+
+        with self._lock:
+            if not self._dirty:
+                return True
+            data = {'version': CACHE_VERSION, 'entries': dict(self.entries)}
+            self._dirty = False
+
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_path)
+            logger.info(f"Loudness cache saved to {self.cache_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving loudness cache: {e}")
+            return False
+
+    def submit(self, paths: Iterable[str]):
+        """
+        Analyse files in the background
+
+        Files whose size and mtime match the cache are not analysed again.
+
+        Args:
+            paths: Audio file paths
+        """
+        jobs = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = self.entries.get(path)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                continue
+            jobs.append(((path,), (path, st.st_size, st.st_mtime_ns)))
+
+        if jobs and self._runner.submit(analyze_file, jobs):
+            logger.info(f"Queued {len(jobs)} tracks for loudness analysis")
+
+    def get_gain(self, path: str, album: bool = True) -> float:
+        """
+        Get the volume factor that brings a track to the target loudness
+
+        Args:
+            path: Song path
+            album: If True, use the loudness of the whole album so quiet and
+                loud songs keep their relation within it
+
+        Returns:
+            float: Linear gain, 1.0 if the track is not analysed yet
+        """
+        with self._lock:
+            entry = self.entries.get(path)
+            if not entry or entry[2] is None:
+                return 1.0
+
+            loudness = entry[2]
+            if album:
+                album_dir = os.path.dirname(path)
+                if album_dir not in self._albums:
+                    self._albums[album_dir] = self._album_loudness(album_dir)
+                loudness = self._albums[album_dir] or loudness
+
+        gain = 10 ** ((self.target_db - loudness) / 20)
+        # Don't let a boost push the loudest sample into clipping
+        if entry[3] > 0:
+            gain = min(gain, 1.0 / entry[3])
+        return gain
+
+    def shutdown(self):
+        """Cancel queued analysis and save the cache"""
+        self._runner.shutdown()
+        self.save()
+
+    def _index_track(self, path: str, entry: list):
+        """Add or update a track in the per-album index (call with the lock held)"""
+        album_dir = os.path.dirname(path)
+        tracks = self._album_tracks.setdefault(album_dir, {})
+        if entry[2] is None:
+            tracks.pop(path, None)
+        else:
+            tracks[path] = (entry[2], entry[4])
+        self._albums.pop(album_dir, None)
+
+    def _album_loudness(self, album_dir: str) -> Optional[float]:
+        """Duration-weighted power mean of the analysed tracks in an album (call with the lock held)"""
+        energy = 0.0
+        duration = 0.0
+        for loudness, track_duration in self._album_tracks.get(album_dir, {}).values():
+            energy += track_duration * 10 ** (loudness / 10)
+            duration += track_duration
+
+        if duration <= 0:
+            return None
+        return 10 * math.log10(energy / duration)
+
+    def _finished(self, job: tuple, future):
+        """Record the result of one analysis"""
+        path, size, mtime_ns = job
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Could not analyse {os.path.basename(path)}: {e}")
+            result = None
+
+        # Unmeasurable files are cached too, so they are not retried until they change
+        loudness, peak, duration = result or (None, 0.0, 0.0)
+
+        with self._lock:
+            self.entries[path] = [size, mtime_ns, loudness, peak, duration]
+            self._index_track(path, self.entries[path])
+            self._dirty = True
+
+    def _idle(self):
+        """Save the cache once every queued analysis has ended"""
+        logger.info("Loudness analysis finished")
+        self.save()
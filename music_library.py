@@ -4,103 +4,405 @@ Scans and organizes music files based on folder structure
 """
 import os
 import logging
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from library_index import LibraryIndex
+from library_search import SearchIndex
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class Song:
+ALBUM_ART_FILENAME = "albumart.png"
+MUSIC_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.flac', '.m4a')
+
+
+def _display_name(stem: str) -> str:
+    """Turn '<seq_no>_<name>' into a display name"""
+    return stem.split('_', 1)[-1].replace('_', ' ').title()
+
+
+# The library classes use __slots__ and store paths relative to their parent
+# (only the Playlist keeps a full path), which roughly halves the memory used
+# per track compared to dataclasses holding absolute paths. An album builds
+# its full path once on first access and songs join it with their file name.
+# Equality compares the same fields the dataclasses did; songs compare their
+# full paths, so albums and artists compare theirs through their songs.
+
+
+class _LibraryNode:
+    """Equality and repr shared by the library classes"""
+    __slots__ = ()
+    
+    # Fields compared by __eq__ and shown by __repr__
+    _key_fields = ()
+    _repr_fields = ()
+    
+    def _key(self):
+        return tuple(getattr(self, field) for field in self._key_fields)
+    
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() == other._key()
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self._repr_fields)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class Song(_LibraryNode):
     """Represents a song"""
-    path: str
-    filename: str
-    seq_no: int
-    name: str
+    __slots__ = ('filename', 'seq_no', '_name', '_path', 'album')
+    _key_fields = ('path', 'filename', 'seq_no', 'name')
+    _repr_fields = ('path', 'filename', 'seq_no', 'name')
+    
+    def __init__(self, path: Optional[str], filename: str, seq_no: int,
+                 name: Optional[str] = None):
+        """
+        Args:
+            path: Full path, only kept until the song is added to an Album
+            filename: File name inside the album directory
+            seq_no: Sequence number parsed from the file name
+            name: Display name, derived from the file name if not given
+        """
+        self.filename = filename
+        self.seq_no = seq_no
+        self._name = name
+        self._path = path
+        # Back-reference set by Album, used for constant-time now-playing lookups
+        self.album: Optional['Album'] = None
+    
+    @property
+    def path(self) -> str:
+        if self.album is not None:
+            return os.path.join(self.album.path, self.filename)
+        return self._path
+    
+    @property
+    def name(self) -> str:
+        if self._name is not None:
+            return self._name
+        return _display_name(os.path.splitext(self.filename)[0])
 
 
-@dataclass
-class Album:
+class Album(_LibraryNode):
     """Represents an album"""
-    path: str
-    seq_no: int
-    name: str
-    songs: List[Song]
-    album_art: Optional[str] = None
+    __slots__ = ('dirname', 'seq_no', 'name', 'songs', 'has_art', '_path', 'artist')
+    _key_fields = ('dirname', 'seq_no', 'name', 'songs', 'has_art')
+    _repr_fields = ('path', 'seq_no', 'name', 'songs', 'album_art')
+    
+    def __init__(self, path: str, seq_no: int, name: str, songs: List[Song],
+                 album_art: Optional[str] = None):
+        """
+        Args:
+            path: Full path, only kept until the album is added to an Artist;
+                then rebuilt through the artist on first access
+            seq_no: Sequence number parsed from the directory name
+            name: Display name
+            songs: Songs in directory order
+            album_art: Path of the album's albumart.png, if it has one
+        """
+        self.dirname = os.path.basename(path)
+        self.seq_no = seq_no
+        self.name = name
+        self.songs = songs
+        self.has_art = album_art is not None
+        self._path = path
+        # Back-reference set by Artist
+        self.artist: Optional['Artist'] = None
+        
+        for song in songs:
+            song.album = self
+            song._path = None
+    
+    @property
+    def path(self) -> str:
+        # Playlist paths never change once built, so the join is done once
+        # per album instead of on every song path access
+        if self._path is None and self.artist is not None:
+            self._path = os.path.join(self.artist.path, self.dirname)
+        return self._path
+    
+    @property
+    def album_art(self) -> Optional[str]:
+        if self.has_art:
+            return os.path.join(self.path, ALBUM_ART_FILENAME)
+        return None
 
 
-@dataclass
-class Artist:
+class Artist(_LibraryNode):
     """Represents an artist"""
-    path: str
-    seq_no: int
-    name: str
-    albums: List[Album]
+    __slots__ = ('dirname', 'seq_no', 'name', 'albums', '_path', 'playlist')
+    _key_fields = ('dirname', 'seq_no', 'name', 'albums')
+    _repr_fields = ('path', 'seq_no', 'name', 'albums')
+    
+    def __init__(self, path: str, seq_no: int, name: str, albums: List[Album]):
+        """
+        Args:
+            path: Full path, only kept until the artist is added to a Playlist
+            seq_no: Sequence number parsed from the directory name
+            name: Display name
+            albums: Albums in directory order
+        """
+        self.dirname = os.path.basename(path)
+        self.seq_no = seq_no
+        self.name = name
+        self.albums = albums
+        self._path = path
+        # Back-reference set by Playlist
+        self.playlist: Optional['Playlist'] = None
+        
+        for album in albums:
+            album.artist = self
+            album._path = None
+    
+    @property
+    def path(self) -> str:
+        if self.playlist is not None:
+            return os.path.join(self.playlist.path, self.dirname)
+        return self._path
 
 
-@dataclass
-class Playlist:
+class Playlist(_LibraryNode):
     """Represents a playlist (NFC ID mapping)"""
-    nfc_id: str
-    path: str
-    artists: List[Artist]
+    __slots__ = ('nfc_id', 'path', 'artists', 'songs')
+    _key_fields = ('nfc_id', 'path', 'artists')
+    _repr_fields = ('nfc_id', 'path', 'artists')
+    
+    def __init__(self, nfc_id: str, path: str, artists: List[Artist]):
+        """
+        Args:
+            nfc_id: NFC tag ID the playlist is mapped to
+            path: Full path of the playlist directory
+            artists: Artists in directory order
+        """
+        self.nfc_id = nfc_id
+        self.path = path
+        self.artists = artists
+        
+        for artist in artists:
+            artist.playlist = self
+            artist._path = None
+        
+        # Play order, computed once when the playlist is built
+        self.songs: List[Song] = []
+        self.build_play_order()
+    
+    def build_play_order(self):
+        """Flatten artists, albums and songs into play order (by sequence number)"""
+        songs = []
+        
+        for artist in sorted(self.artists, key=lambda a: a.seq_no):
+            for album in sorted(artist.albums, key=lambda a: a.seq_no):
+                songs.extend(sorted(album.songs, key=lambda s: s.seq_no))
+        
+        self.songs = songs
 
 
 class MusicLibrary:
     """Manages music library and playlist organization"""
     
-    def __init__(self, library_path="music"):
+    def __init__(self, library_path="music", index_path: Optional[str] = None,
+                 scan_workers: int = 4, lazy: bool = False,
+                 max_cached_playlists: int = 16, max_cached_songs: int = 20000):
         """
         Initialize music library
         
         Args:
             library_path: Root path to music library
+            index_path: Optional path of the persistent library index file
+            scan_workers: Number of playlist directories scanned concurrently
+            lazy: If True, only list NFC ID folders at scan time and scan each
+                playlist on first use, keeping recently used ones in an LRU
+            max_cached_playlists: Lazy mode limit on playlists kept in memory
+            max_cached_songs: Lazy mode limit on songs kept in memory
         """
         self.library_path = library_path
-        self.playlists: Dict[str, Playlist] = {}
+        self.index_path = index_path
+        self.scan_workers = max(1, scan_workers)
+        self.lazy = lazy
+        self.max_cached_playlists = max(1, max_cached_playlists)
+        self.max_cached_songs = max_cached_songs
+        
+        # In lazy mode this is an LRU of scanned playlists, oldest first
+        self.playlists: Dict[str, Playlist] = OrderedDict()
+        self.playlist_ids: List[str] = []
+        self.cached_songs = 0
+        self.index = LibraryIndex(index_path, library_path)
+        self.search_index = SearchIndex()
+        # Lazy mode: playlists scanned only for the search index, not cached
+        self.search_playlists: Dict[str, Playlist] = {}
+        self._search_lock = threading.Lock()
+        self._lock = threading.RLock()
         
         # Create music directory if it doesn't exist
         if not os.path.exists(library_path):
             os.makedirs(library_path)
             logger.info(f"Created music library directory: {library_path}")
     
-    def scan_library(self):
-        """Scan music library and build playlist index"""
-        self.playlists = {}
+    def scan_library(self, full_rescan: bool = False):
+        """
+        Scan music library and build playlist index
+        
+        Directories whose mtime is unchanged since the last scan reuse their
+        listing from the library index instead of being read again. In lazy
+        mode only the NFC ID folders are listed here.
+        
+        Args:
+            full_rescan: If True, ignore the library index and read every directory
+        """
+        with self._lock:
+            self._scan_library(full_rescan)
+    
+    def _scan_library(self, full_rescan: bool):
+        """Scan music library while holding the library lock"""
+        self.playlists = OrderedDict()
+        self.playlist_ids = []
+        self.cached_songs = 0
+        self.search_playlists = {}
         
         if not os.path.exists(self.library_path):
             logger.warning(f"Music library path does not exist: {self.library_path}")
             return
         
+        # The index may describe a different tree if the path was changed
+        if self.index.library_path != self.library_path:
+            self.index = LibraryIndex(self.index_path, self.library_path)
+        
+        self.index.begin_scan(full_rescan)
+        
         # Scan for NFC ID directories
         try:
-            for nfc_id in os.listdir(self.library_path):
-                nfc_path = os.path.join(self.library_path, nfc_id)
-                
-                if not os.path.isdir(nfc_path):
-                    continue
-                
-                playlist = self._scan_playlist(nfc_id, nfc_path)
+            nfc_ids, _ = self.index.list_dir(self.library_path)
+            self.playlist_ids = list(nfc_ids)
+            
+            if self.lazy:
+                # Playlists are scanned on first use by get_playlist()
+                self.index.save()
+                logger.info(f"Lazy library scan complete. Found {len(nfc_ids)} playlist folders")
+                return
+            
+            def scan(nfc_id):
+                return self._scan_playlist(nfc_id, os.path.join(self.library_path, nfc_id))
+            
+            # Playlist directories are independent, so they are scanned on a
+            # bounded pool; map() keeps results in directory order
+            if self.scan_workers > 1 and len(nfc_ids) > 1:
+                with ThreadPoolExecutor(max_workers=self.scan_workers) as pool:
+                    results = list(pool.map(scan, nfc_ids))
+            else:
+                results = [scan(nfc_id) for nfc_id in nfc_ids]
+            
+            for nfc_id, playlist in zip(nfc_ids, results):
                 if playlist:
                     self.playlists[nfc_id] = playlist
+                    self.cached_songs += len(playlist.songs)
                     logger.info(f"Loaded playlist for NFC ID: {nfc_id}")
         
         except Exception as e:
             logger.error(f"Error scanning music library: {e}")
         
+        self.index.end_scan()
+        
         logger.info(f"Music library scan complete. Found {len(self.playlists)} playlists")
     
+    def refresh_paths(self, paths) -> List[str]:
+        """
+        Update only the playlists containing the given changed directories
+        
+        Updated playlists keep their Playlist object so references held
+        elsewhere (e.g. the app's current playlist) see the new contents.
+        
+        Args:
+            paths: Directories inside the library whose entries changed
+        
+        Returns:
+            list: NFC IDs of playlists that were added, updated or removed
+        """
+        library_path = os.path.abspath(self.library_path)
+        nfc_ids = set()
+        
+        with self._lock:
+            for path in paths:
+                self.index.invalidate(path)
+                rel_path = os.path.relpath(os.path.abspath(path), library_path)
+                
+                if rel_path == os.curdir:
+                    nfc_ids.update(self._refresh_playlist_ids())
+                elif not rel_path.startswith(os.pardir):
+                    nfc_ids.add(rel_path.split(os.sep)[0])
+            
+            for nfc_id in nfc_ids:
+                self.search_playlists.pop(nfc_id, None)
+            
+            changed = [nfc_id for nfc_id in sorted(nfc_ids) if self._refresh_playlist(nfc_id)]
+            if changed:
+                self.index.save()
+        
+        return changed
+    
+    def _refresh_playlist_ids(self) -> set:
+        """Re-list NFC ID folders and return the IDs that were added or removed"""
+        try:
+            nfc_ids, _ = self.index.list_dir(self.library_path)
+        except Exception as e:
+            logger.error(f"Error listing music library: {e}")
+            return set()
+        
+        previous = set(self.playlist_ids)
+        self.playlist_ids = list(nfc_ids)
+        return previous.symmetric_difference(nfc_ids)
+    
+    def _refresh_playlist(self, nfc_id: str) -> bool:
+        """Rescan one playlist in place, returning True if it changed"""
+        old = self.playlists.get(nfc_id)
+        nfc_path = os.path.join(self.library_path, nfc_id)
+        
+        # Lazy playlists that were never tapped are scanned on first use anyway
+        if self.lazy and old is None:
+            return False
+        
+        new = self._scan_playlist(nfc_id, nfc_path) if os.path.isdir(nfc_path) else None
+        
+        if new is None:
+            if old is None:
+                return False
+            del self.playlists[nfc_id]
+            self.cached_songs -= len(old.songs)
+            logger.info(f"Removed playlist for NFC ID: {nfc_id}")
+            return True
+        
+        if old is None:
+            self.playlists[nfc_id] = new
+            self.cached_songs += len(new.songs)
+            logger.info(f"Loaded playlist for NFC ID: {nfc_id}")
+            return True
+        
+        if new.artists == old.artists:
+            return False
+        
+        self.cached_songs += len(new.songs) - len(old.songs)
+        for artist in new.artists:
+            artist.playlist = old
+        old.artists = new.artists
+        old.songs = new.songs
+        logger.info(f"Updated playlist for NFC ID: {nfc_id}")
+        return True
+    
     def _scan_playlist(self, nfc_id: str, path: str) -> Optional[Playlist]:
         """Scan a playlist directory"""
         artists = []
         
         try:
-            for artist_dir in sorted(os.listdir(path)):
+            artist_dirs, _ = self.index.list_dir(path)
+            
+            for artist_dir in artist_dirs:
                 artist_path = os.path.join(path, artist_dir)
                 
-                if not os.path.isdir(artist_path):
-                    continue
-                
                 artist = self._scan_artist(artist_dir, artist_path)
                 if artist:
                     artists.append(artist)
@@ -131,12 +433,11 @@ class MusicLibrary:
         albums = []
         
         try:
-            for album_dir in sorted(os.listdir(path)):
+            album_dirs, _ = self.index.list_dir(path)
+            
+            for album_dir in album_dirs:
                 album_path = os.path.join(path, album_dir)
                 
-                if not os.path.isdir(album_path):
-                    continue
-                
                 album = self._scan_album(album_dir, album_path)
                 if album:
                     albums.append(album)
@@ -167,20 +468,18 @@ class MusicLibrary:
         songs = []
         album_art = None
         
-        # Look for album art
-        album_art_path = os.path.join(path, "albumart.png")
-        if os.path.exists(album_art_path):
-            album_art = album_art_path
-        
         try:
-            for filename in sorted(os.listdir(path)):
+            _, filenames = self.index.list_dir(path)
+            
+            # Look for album art
+            if ALBUM_ART_FILENAME in filenames:
+                album_art = os.path.join(path, ALBUM_ART_FILENAME)
+            
+            for filename in filenames:
                 file_path = os.path.join(path, filename)
                 
-                if not os.path.isfile(file_path):
-                    continue
-                
                 # Check if it's a music file
-                if not filename.lower().endswith(('.mp3', '.wav', '.ogg', '.flac', '.m4a')):
+                if not filename.lower().endswith(MUSIC_EXTENSIONS):
                     continue
                 
                 song = self._parse_song(filename, file_path)
@@ -213,43 +512,149 @@ class MusicLibrary:
                 return None
             
             seq_no = int(parts[0])
-            name = parts[1].replace('_', ' ').title()
             
-            return Song(path=path, filename=filename, seq_no=seq_no, name=name)
+            # The display name is derived from the filename when needed
+            return Song(path=path, filename=filename, seq_no=seq_no)
         
         except ValueError:
             logger.warning(f"Invalid song filename: {filename}")
             return None
     
     def get_playlist(self, nfc_id: str) -> Optional[Playlist]:
-        """Get playlist by NFC ID"""
-        return self.playlists.get(nfc_id)
+        """Get playlist by NFC ID, scanning it on first use in lazy mode"""
+        return self.fetch_playlist(nfc_id)[0]
+    
+    def fetch_playlist(self, nfc_id: str) -> Tuple[Optional[Playlist], bool]:
+        """
+        Get playlist by NFC ID and whether it had to be scanned for this call
+        
+        Returns:
+            tuple: (Playlist or None, True if it was just scanned in lazy mode)
+        """
+        if not self.lazy:
+            return self.playlists.get(nfc_id), False
+        
+        with self._lock:
+            playlist = self.playlists.get(nfc_id)
+            if playlist:
+                self.playlists.move_to_end(nfc_id)
+                return playlist, False
+            
+            # Folders added after startup are picked up here as well
+            nfc_path = os.path.join(self.library_path, nfc_id)
+            if not os.path.isdir(nfc_path):
+                return None, False
+            
+            if nfc_id not in self.playlist_ids:
+                self.playlist_ids.append(nfc_id)
+            
+            # A playlist already scanned for the search index is reused
+            playlist = self.search_playlists.pop(nfc_id, None) or self._scan_playlist(nfc_id, nfc_path)
+            if playlist:
+                self.playlists[nfc_id] = playlist
+                self.cached_songs += len(playlist.songs)
+                logger.info(f"Loaded playlist for NFC ID: {nfc_id}")
+                self._evict_playlists()
+            
+            return playlist, playlist is not None
+    
+    def update_search_index(self, include_unloaded: bool = False):
+        """
+        Index names of playlists that were loaded or rescanned since the last update
+        
+        Runs the playlist scans it needs, so call it off the UI thread.
+        
+        Args:
+            include_unloaded: In lazy mode, also scan and index the playlists
+                that are not loaded. They are kept for searching only, outside
+                the playlist cache, until release_search_index() is called.
+        """
+        with self._search_lock:
+            playlists = self.get_loaded_playlists()
+            if self.lazy and include_unloaded:
+                loaded = {playlist.nfc_id for playlist in playlists}
+                for nfc_id in self.get_playlist_ids():
+                    if nfc_id in loaded:
+                        continue
+                    playlist = self.search_playlists.get(nfc_id)
+                    if playlist is None:
+                        playlist = self._scan_playlist(nfc_id, os.path.join(self.library_path, nfc_id))
+                        if playlist is None:
+                            continue
+                        self.search_playlists[nfc_id] = playlist
+                    playlists.append(playlist)
+            self.search_index.update(playlists)
+    
+    def release_search_index(self):
+        """Drop the playlists scanned only for searching, leaving loaded ones indexed"""
+        with self._search_lock:
+            self.search_playlists = {}
+            self.search_index.update(self.get_loaded_playlists())
+    
+    def search(self, query: str, limit: int = 50) -> List[tuple]:
+        """
+        Search artist, album and song names
+        
+        Only queries the index; update_search_index() brings it up to date.
+        In lazy mode playlists that are not loaded are only searched while the
+        index was last updated with include_unloaded.
+        
+        Args:
+            query: Search text, each word may be a prefix
+            limit: Maximum number of results
+        
+        Returns:
+            list: (nfc_id, Artist, Album or None, Song or None) tuples
+        """
+        return self.search_index.search(query, limit)
+    
+    def get_loaded_playlists(self) -> List[Playlist]:
+        """Get the playlists currently held in memory"""
+        with self._lock:
+            return list(self.playlists.values())
+    
+    def get_playlist_ids(self) -> List[str]:
+        """Get NFC IDs of all playlists, including ones not scanned yet in lazy mode"""
+        if self.lazy:
+            return list(self.playlist_ids)
+        return list(self.playlists)
+    
+    def save_index(self) -> bool:
+        """Persist the library index, including playlists scanned lazily"""
+        with self._lock:
+            return self.index.save()
+    
+    def _evict_playlists(self):
+        """Drop least recently used playlists until the cache is within its limits"""
+        while len(self.playlists) > 1 and (
+                len(self.playlists) > self.max_cached_playlists or
+                self.cached_songs > self.max_cached_songs):
+            nfc_id, playlist = self.playlists.popitem(last=False)
+            self.cached_songs -= len(playlist.songs)
+            logger.info(f"Evicted playlist for NFC ID: {nfc_id}")
     
     def get_all_songs(self, nfc_id: str) -> List[Song]:
-        """Get all songs in a playlist in order"""
+        """
+        Get all songs in a playlist in order
+        
+        Returns the playlist's precomputed play order; callers must not modify it.
+        """
         playlist = self.get_playlist(nfc_id)
         if not playlist:
             return []
         
-        all_songs = []
-        for artist in sorted(playlist.artists, key=lambda a: a.seq_no):
-            for album in sorted(artist.albums, key=lambda a: a.seq_no):
-                for song in sorted(album.songs, key=lambda s: s.seq_no):
-                    all_songs.append(song)
-        
-        return all_songs
+        return playlist.songs
     
     def get_song_info(self, song: Song, playlist: Playlist) -> dict:
         """Get detailed information about a song including artist and album"""
-        for artist in playlist.artists:
-            for album in artist.albums:
-                if song in album.songs:
-                    return {
-                        'song': song.name,
-                        'artist': artist.name,
-                        'album': album.name,
-                        'album_art': album.album_art
-                    }
+        album = song.album
+        if album is not None and album.artist is not None:
+            return {
+                'song': song.name,
+                'artist': album.artist.name,
+                'album': album.name,
+                'album_art': album.album_art
+            }
         return {
             'song': song.name,
             'artist': 'Unknown',
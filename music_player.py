@@ -2,6 +2,7 @@
 Music Player
 Handles music playback using pygame
 """
+import time
 import pygame
 import logging
 from typing import List, Optional, Callable
@@ -13,21 +14,61 @@ logger = logging.getLogger(__name__)
 class MusicPlayer:
     """Manages music playback"""
     
-    def __init__(self):
-        """Initialize music player"""
+    # Songs that may fail to load in one play() call before playback stops
+    MAX_FAILED_LOADS = 10
+    
+    def __init__(self, gapless: bool = False):
+        """
+        Initialize music player
+        
+        Args:
+            gapless: If True, queue the next song while the current one plays
+                so the mixer switches tracks without reloading in between
+        """
         pygame.mixer.init()
         self.current_playlist: List[Song] = []
         self.current_index: int = -1
         self.is_playing: bool = False
+        self.gapless = gapless
+        # Playlist index of the song queued in the mixer (gapless mode)
+        self.queued_index: Optional[int] = None
         self.volume: float = 0.7
         self.on_song_change: Optional[Callable] = None
         
+        # Optional MetadataIndexer providing track durations
+        self.metadata = None
+        # Optional StagingCache with local copies of upcoming songs
+        self.staging = None
+        # Optional TranscodeCache with cheap-to-decode copies of songs
+        self.transcodes = None
+        # Optional LoudnessAnalyzer; its gain is applied on top of volume
+        self.loudness = None
+        self.album_gain = True
+        # Optional Quarantine of songs that failed to load
+        self.quarantine = None
+        # Optional SoundCache; short songs then play from memory on a channel
+        self.sounds = None
+        # Optional LatencyTracker; song loads and starts are timed
+        self.latency = None
+        self.channel: Optional[pygame.mixer.Channel] = None
+        self._sound_started = 0.0
+        self._sound_paused = 0.0
+        self._sound_length: Optional[float] = None
+        self._queued_sound_length: Optional[float] = None
+        # Where the current song was started from; get_pos() counts from there
+        self._start_position = 0.0
+        
         pygame.mixer.music.set_volume(self.volume)
         
         # Set up end event
         self.SONG_END = pygame.USEREVENT + 1
         pygame.mixer.music.set_endevent(self.SONG_END)
         
+        # Reserve a channel for songs played from memory
+        pygame.mixer.set_reserved(1)
+        self.sound_channel = pygame.mixer.Channel(0)
+        self.sound_channel.set_endevent(self.SONG_END)
+        
         logger.info("Music player initialized")
     
     def load_playlist(self, songs: List[Song]):
@@ -42,12 +83,46 @@ class MusicPlayer:
         self.current_index = -1
         logger.info(f"Loaded playlist with {len(songs)} songs")
     
-    def play(self, index: int = 0):
+    def update_playlist(self, songs: List[Song]):
+        """
+        Replace the songs of the loaded playlist without interrupting playback
+        
+        The current song keeps playing and current_index follows it to its new
+        position. If it was removed, playback continues with the song that
+        took its place once it ends.
+        
+        Args:
+            songs: Updated list of Song objects
+        """
+        current = self.get_current_song()
+        new_index = -1
+        
+        if current:
+            for i, song in enumerate(songs):
+                if song.path == current.path:
+                    new_index = i
+                    break
+            else:
+                new_index = min(self.current_index, len(songs)) - 1
+        
+        self.current_playlist = songs
+        self.current_index = new_index
+        logger.info(f"Updated playlist, now {len(songs)} songs")
+        
+        # The queued song may have moved or been removed
+        if self.queued_index is not None:
+            self._queue_next()
+    
+    def play(self, index: int = 0, start_position: float = 0.0):
         """
         Start playing from specified index
         
+        Songs that fail to load are quarantined and playback moves on to the
+        following song, giving up after MAX_FAILED_LOADS failures.
+        
         Args:
             index: Index in playlist to start from (default: 0)
+            start_position: Seconds into the song at index to start at
         """
         if not self.current_playlist:
             logger.warning("No playlist loaded")
@@ -57,42 +132,82 @@ class MusicPlayer:
             logger.warning(f"Invalid playlist index: {index}")
             return
         
-        self.current_index = index
-        song = self.current_playlist[self.current_index]
+        song = None
+        failed = 0
         
-        try:
-            pygame.mixer.music.load(song.path)
-            pygame.mixer.music.play()
-            self.is_playing = True
-            logger.info(f"Playing: {song.name}")
+        for offset in range(len(self.current_playlist)):
+            candidate_index = (index + offset) % len(self.current_playlist)
+            candidate = self.current_playlist[candidate_index]
             
-            if self.on_song_change:
-                self.on_song_change(song, self.current_index)
+            if self._is_quarantined(candidate):
+                logger.info(f"Skipping quarantined song: {candidate.name}")
+                continue
+            
+            try:
+                # Set the song's gain first so it doesn't start at the previous one's
+                self._apply_volume(candidate)
+                self._start(candidate, start_position if offset == 0 else 0.0)
+            except Exception as e:
+                logger.error(f"Error playing song {candidate.name}: {e}")
+                # Decoder errors are permanent; I/O errors may not be
+                if self.quarantine and isinstance(e, pygame.error):
+                    self.quarantine.add(candidate.path, str(e))
+                failed += 1
+                if failed >= self.MAX_FAILED_LOADS:
+                    break
+                continue
+            
+            song = candidate
+            self.current_index = candidate_index
+            break
         
-        except Exception as e:
-            logger.error(f"Error playing song {song.name}: {e}")
-            # Try next song
-            self.next()
+        if self.quarantine:
+            self.quarantine.save()
+        
+        if song is None:
+            logger.error(f"No playable song found after {failed} failed loads, stopping")
+            self.stop()
+            return
+        
+        self.is_playing = True
+        self.queued_index = None
+        logger.info(f"Playing: {song.name}")
+        
+        if self.on_song_change:
+            self.on_song_change(song, self.current_index)
+        
+        self._stage_upcoming()
+        if self.gapless:
+            self._queue_next()
     
     def pause(self):
         """Pause playback"""
         if self.is_playing:
-            pygame.mixer.music.pause()
+            if self.channel:
+                self.channel.pause()
+                self._sound_paused = time.monotonic()
+            else:
+                pygame.mixer.music.pause()
             self.is_playing = False
             logger.info("Playback paused")
     
     def unpause(self):
         """Resume playback"""
         if not self.is_playing and self.current_index >= 0:
-            pygame.mixer.music.unpause()
+            if self.channel:
+                self.channel.unpause()
+                self._sound_started += time.monotonic() - self._sound_paused
+            else:
+                pygame.mixer.music.unpause()
             self.is_playing = True
             logger.info("Playback resumed")
     
     def stop(self):
         """Stop playback"""
-        pygame.mixer.music.stop()
+        self._halt()
         self.is_playing = False
         self.current_index = -1
+        self.queued_index = None
         logger.info("Playback stopped")
     
     def next(self):
@@ -129,7 +244,7 @@ class MusicPlayer:
             volume: Volume level (0.0 to 1.0)
         """
         self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
+        self._apply_volume()
         logger.info(f"Volume set to {self.volume}")
     
     def get_current_song(self) -> Optional[Song]:
@@ -138,9 +253,199 @@ class MusicPlayer:
             return self.current_playlist[self.current_index]
         return None
     
+    def get_position(self) -> float:
+        """Get playback position in the current song in seconds"""
+        if self.current_index < 0:
+            return 0.0
+        if self.channel:
+            now = time.monotonic() if self.is_playing else self._sound_paused
+            return now - self._sound_started
+        return self._start_position + max(0, pygame.mixer.music.get_pos()) / 1000.0
+    
+    def get_time_remaining(self) -> Optional[float]:
+        """Get remaining time of the current song in seconds, if its duration is known"""
+        song = self.get_current_song()
+        if not song:
+            return None
+        
+        if self.channel:
+            duration = self._sound_length
+        else:
+            duration = self.metadata.get_duration(song.path) if self.metadata else None
+        if not duration:
+            return None
+        return max(0.0, duration - self.get_position())
+    
     def handle_song_end(self):
         """Handle end of song event - automatically play next"""
-        if self.is_playing:
-            logger.info("Song ended, playing next")
-            self.next()
-
+        if not self.is_playing:
+            return
+        
+        busy = self.channel.get_busy() if self.channel else pygame.mixer.music.get_busy()
+        if busy and self.queued_index is None:
+            # Left over from a song that was replaced before the event was read
+            logger.debug("Ignoring end event while a song is playing")
+            return
+        
+        # In gapless mode the mixer has already started the queued song
+        if self.queued_index is not None and busy:
+            self.current_index = self.queued_index
+            self.queued_index = None
+            self._sound_started = time.monotonic()
+            self._sound_length = self._queued_sound_length
+            self._start_position = 0.0
+            self._apply_volume()
+            song = self.current_playlist[self.current_index]
+            logger.info(f"Song ended, playing queued: {song.name}")
+            
+            if self.on_song_change:
+                self.on_song_change(song, self.current_index)
+            
+            self._stage_upcoming()
+            self._queue_next()
+            return
+        
+        logger.info("Song ended, playing next")
+        self.next()
+    
+    def _queue_next(self):
+        """Queue the song after the current one in the mixer"""
+        self.queued_index = None
+        if not self.current_playlist or self.current_index < 0:
+            return
+        
+        next_index = (self.current_index + 1) % len(self.current_playlist)
+        song = self.current_playlist[next_index]
+        if self._is_quarantined(song):
+            # play() skips it when the current song ends
+            return
+        
+        try:
+            # A song can only be queued behind one played the same way;
+            # otherwise it starts when the current one ends
+            if self.channel:
+                sound = self._get_sound(song)
+                if not sound:
+                    return
+                self.channel.queue(sound)
+                self._queued_sound_length = sound.get_length()
+            elif self._plays_as_sound(song):
+                # Decoded when it starts instead
+                return
+            else:
+                pygame.mixer.music.queue(self._playback_path(song))
+            self.queued_index = next_index
+        except Exception as e:
+            # Falls back to loading the song when the current one ends
+            logger.warning(f"Could not queue {song.name}: {e}")
+    
+    def _start(self, song: Song, start_position: float = 0.0):
+        """Load and start a song, from memory if it is cached as a sound"""
+        self._start_position = 0.0
+        latency = self.latency
+        started = time.monotonic() if latency else None
+        sound = self._get_sound(song)
+        if sound:
+            if latency:
+                loaded = time.monotonic()
+                latency.record('mixer_load', loaded - started)
+            # Sounds are short, they always start from the beginning
+            self._play_sound(sound)
+            if latency:
+                latency.record('mixer_play', time.monotonic() - loaded)
+            return
+        
+        if self.channel:
+            self._halt()
+        pygame.mixer.music.load(self._playback_path(song))
+        if latency:
+            loaded = time.monotonic()
+            latency.record('mixer_load', loaded - started)
+        
+        self._play_music(song, start_position)
+        if latency:
+            latency.record('mixer_play', time.monotonic() - loaded)
+    
+    def _play_music(self, song: Song, start_position: float):
+        """Start the loaded music, seeking if the format allows it"""
+        if start_position > 0:
+            try:
+                pygame.mixer.music.play(start=start_position)
+                self._start_position = start_position
+                return
+            except pygame.error as e:
+                # Not every format can seek (e.g. WAV)
+                logger.info(f"Cannot start {song.name} at {start_position:.0f}s: {e}")
+        pygame.mixer.music.play()
+    
+    def _playback_path(self, song: Song) -> str:
+        """Get the file to load for a song, preferring a transcoded or staged local copy"""
+        if self.transcodes:
+            transcoded = self.transcodes.get_path(song.path)
+            if transcoded:
+                return transcoded
+        if self.staging:
+            return self.staging.get_path(song.path)
+        return song.path
+    
+    def _is_quarantined(self, song: Song) -> bool:
+        """Check whether a song failed to load before and has no transcoded copy since"""
+        if not self.quarantine or not self.quarantine.contains(song.path):
+            return False
+        return not (self.transcodes and self.transcodes.get_path(song.path))
+    
+    def _plays_as_sound(self, song: Song) -> bool:
+        """Check whether a song is short enough to play from memory, without decoding it"""
+        if not self.sounds:
+            return False
+        duration = self.metadata.get_duration(song.path) if self.metadata else None
+        return self.sounds.is_eligible(song.path, duration)
+    
+    def _get_sound(self, song: Song) -> Optional[pygame.mixer.Sound]:
+        """Get a song decoded in memory if it is short enough to play that way"""
+        if not self._plays_as_sound(song):
+            return None
+        return self.sounds.get(song.path, self._playback_path(song))
+    
+    def _play_sound(self, sound: pygame.mixer.Sound):
+        """Play a decoded song on the reserved channel"""
+        # Unlike loading music, replacing a playing sound posts an end event
+        self._halt()
+        self.sound_channel.play(sound)
+        self._sound_length = sound.get_length()
+        self.channel = self.sound_channel
+        self._sound_started = time.monotonic()
+    
+    def _apply_volume(self, song: Optional[Song] = None):
+        """Set the mixer volume to the volume times the loudness gain of song (default: current song)"""
+        volume = self.volume
+        song = song or self.get_current_song()
+        if self.loudness and song:
+            volume = min(1.0, volume * self.loudness.get_gain(song.path, self.album_gain))
+        
+        pygame.mixer.music.set_volume(volume)
+        self.sound_channel.set_volume(volume)
+    
+    def _halt(self):
+        """Stop both the streamed and the in-memory playback"""
+        pygame.mixer.music.stop()
+        self.sound_channel.stop()
+        self.channel = None
+        
+        # Stopping posts an end event; drop it so it isn't taken for the end
+        # of the next song that starts playing
+        try:
+            pygame.event.clear(self.SONG_END, pump=False)
+        except pygame.error:
+            pass
+    
+    def _stage_upcoming(self):
+        """Ask the staging cache to copy the current song and the ones after it"""
+        if not self.staging or self.current_index < 0:
+            return
+        
+        count = min(len(self.current_playlist), self.staging.lookahead + 1)
+        self.staging.stage([
+            self.current_playlist[(self.current_index + i) % len(self.current_playlist)].path
+            for i in range(count)
+        ])
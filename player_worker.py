@@ -0,0 +1,284 @@
+"""
+Player Worker
+Runs music player commands on a dedicated audio thread
+"""
+import time
+import logging
+import threading
+import pygame
+from collections import deque, namedtuple
+from typing import Callable, List, Optional
+
+from music_library import Song
+
+logger = logging.getLogger(__name__)
+
+# Commands that decide what plays regardless of what came before them
+ABSOLUTE_COMMANDS = {'load_playlist', 'stop'}
+# Commands that change playback and are moot once an absolute command follows
+PLAYBACK_COMMANDS = ABSOLUTE_COMMANDS | {
+    'play', 'next', 'previous', 'pause', 'unpause', 'update_playlist'
+}
+
+# End-of-song detection: sleep until shortly before the song should end, then
+# check often until it does
+END_MARGIN = 0.25
+END_POLL = 0.02
+# Limits how late a song is noticed when its duration is wrong or unknown
+MAX_END_WAIT = 5.0
+UNKNOWN_END_POLL = 0.1
+# Fast checks allowed past the expected end before falling back to slow ones
+MAX_END_POLLS = 50
+
+# What the audio thread last saw the player doing: the playlist's song list,
+# the current index, its song path (None if stopped), the position in seconds,
+# whether it was playing and the monotonic time of the snapshot
+PlayerState = namedtuple('PlayerState', ['songs', 'index', 'path', 'position', 'playing', 'taken_at'])
+
+
+class PlayerWorker:
+    """Serialises all MusicPlayer calls on one thread, keeping slow loads off the UI"""
+
+    def __init__(self, music_player, dispatch: Optional[Callable[[Callable], None]] = None):
+        """
+        Initialize player worker
+
+        Args:
+            music_player: MusicPlayer to drive; only this worker may call it
+            dispatch: Runs a callable on the UI thread, e.g.
+                lambda func: root.after(0, func). Callbacks run on the worker
+                thread if not given.
+        """
+        self.music_player = music_player
+        self.dispatch = dispatch
+        self.on_song_change: Optional[Callable[[Song, int], None]] = None
+        # Optional LatencyTracker for the tap-to-audio stages run here
+        self.latency = None
+        self.superseded = 0
+        self.wakeups = 0
+        self._end_polls = 0
+        # Replaced, never modified, by the audio thread
+        self._state = PlayerState(None, -1, None, 0.0, False, 0.0)
+
+        self._commands = deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        music_player.on_song_change = self._song_changed
+
+    def start(self):
+        """Start the audio thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='player', daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Run the commands already queued, then stop the audio thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def load_playlist(self, songs: List[Song], start_index: int = 0, start_position: float = 0.0,
+                      tapped_at: Optional[float] = None):
+        """
+        Load a playlist and start playing it, cancelling pending commands
+
+        Args:
+            songs: Songs of the playlist
+            start_index: Index of the song to start with
+            start_position: Seconds into that song to start at
+            tapped_at: Monotonic time of the tag read that chose the playlist,
+                to measure tap-to-audio latency
+        """
+        submitted_at = time.monotonic() if self.latency else None
+        self._submit('load_playlist', songs, start_index, start_position, tapped_at, submitted_at)
+
+    def play(self, index: int = 0):
+        """Play the song at index in the loaded playlist"""
+        self._submit('play', index)
+
+    def next(self):
+        """Play the next song"""
+        self._submit('next')
+
+    def previous(self):
+        """Play the previous song"""
+        self._submit('previous')
+
+    def pause(self):
+        """Pause playback"""
+        self._submit('pause')
+
+    def unpause(self):
+        """Resume playback"""
+        self._submit('unpause')
+
+    def stop(self):
+        """Stop playback, cancelling pending commands"""
+        self._submit('stop')
+
+    def set_volume(self, volume: float):
+        """Set playback volume (0.0 to 1.0)"""
+        self._submit('set_volume', volume)
+
+    def update_playlist(self, songs: List[Song]):
+        """Replace the songs of the loaded playlist without interrupting playback"""
+        self._submit('update_playlist', songs)
+
+    def get_state(self) -> PlayerState:
+        """
+        Get the player state the audio thread published last
+
+        Safe to call from any thread. Index, path and position always belong
+        to the same song; while playing, the position is advanced to now.
+        """
+        state = self._state
+        if state.playing:
+            now = time.monotonic()
+            return state._replace(position=state.position + now - state.taken_at, taken_at=now)
+        return state
+
+    def pending(self) -> int:
+        """Number of commands waiting to run"""
+        with self._condition:
+            return len(self._commands)
+
+    def _submit(self, name: str, *args):
+        """Queue a command for the audio thread"""
+        with self._condition:
+            self._commands.append((name, args))
+            self._condition.notify()
+
+    def _run(self):
+        """Run queued commands and detect song ends until shut down"""
+        while True:
+            with self._condition:
+                if self._running and not self._commands:
+                    # Sleeps indefinitely while nothing is playing
+                    self._condition.wait(self._end_timeout())
+                    self.wakeups += 1
+                if not self._running and not self._commands:
+                    return
+                batch = list(self._commands)
+                self._commands.clear()
+
+            # Commands first: a stop or new playlist discards a pending end event
+            if batch:
+                self._run_batch(batch)
+            self._check_song_end()
+            self._publish_state()
+
+    def _run_batch(self, batch: List[tuple]):
+        """Run a batch of commands after dropping superseded ones"""
+        self._end_polls = 0
+        for name, args in self._collapse(batch):
+            try:
+                if name == 'load_playlist':
+                    self._load_playlist(*args)
+                else:
+                    getattr(self.music_player, name)(*args)
+            except Exception as e:
+                logger.error(f"Error running player command {name}: {e}")
+
+    def _load_playlist(self, songs: List[Song], start_index: int, start_position: float,
+                       tapped_at: Optional[float], submitted_at: Optional[float]):
+        """Load and start a playlist, timing each step if latency is tracked"""
+        latency = self.latency
+        if not latency:
+            self.music_player.load_playlist(songs)
+            self.music_player.play(start_index, start_position)
+            return
+
+        started = time.monotonic()
+        if submitted_at is not None:
+            latency.record('player_queue', started - submitted_at)
+        self.music_player.load_playlist(songs)
+        latency.record('load_playlist', time.monotonic() - started)
+        self.music_player.play(start_index, start_position)
+        if tapped_at is not None and self.music_player.is_playing:
+            latency.record('tap_to_audio', time.monotonic() - tapped_at)
+
+    def _publish_state(self):
+        """Snapshot the player for other threads; it wakes at least every MAX_END_WAIT while playing"""
+        player = self.music_player
+        try:
+            song = player.get_current_song()
+            self._state = PlayerState(
+                player.current_playlist,
+                player.current_index,
+                song.path if song else None,
+                player.get_position() if song else 0.0,
+                player.is_playing,
+                time.monotonic()
+            )
+        except Exception as e:
+            logger.error(f"Error reading player state: {e}")
+
+    def _end_timeout(self) -> Optional[float]:
+        """Seconds the audio thread can sleep before the current song may end"""
+        player = self.music_player
+        if not player.is_playing:
+            return None
+
+        remaining = player.get_time_remaining()
+        if remaining is None or self._end_polls >= MAX_END_POLLS:
+            return UNKNOWN_END_POLL
+        if remaining > END_MARGIN:
+            return min(remaining - END_MARGIN, MAX_END_WAIT)
+
+        self._end_polls += 1
+        return END_POLL
+
+    def _check_song_end(self):
+        """Handle the mixer's end-of-song event if it was posted"""
+        try:
+            # Reading without pumping is safe off the main thread
+            ended = pygame.event.get(self.music_player.SONG_END, pump=False)
+        except pygame.error:
+            return
+
+        if ended:
+            self._end_polls = 0
+            try:
+                self.music_player.handle_song_end()
+            except Exception as e:
+                logger.error(f"Error handling end of song: {e}")
+
+    def _collapse(self, batch: List[tuple]) -> List[tuple]:
+        """Drop commands made stale by later ones in the same batch"""
+        last_absolute = -1
+        last_volume = -1
+        for i, (name, _) in enumerate(batch):
+            if name in ABSOLUTE_COMMANDS:
+                last_absolute = i
+            elif name == 'set_volume':
+                last_volume = i
+
+        commands = []
+        for i, command in enumerate(batch):
+            name = command[0]
+            if (name in PLAYBACK_COMMANDS and i < last_absolute) or \
+                    (name == 'set_volume' and i != last_volume):
+                continue
+            commands.append(command)
+
+        dropped = len(batch) - len(commands)
+        if dropped:
+            self.superseded += dropped
+            logger.info(f"Skipped {dropped} superseded player commands")
+        return commands
+
+    def _song_changed(self, song: Song, index: int):
+        """Forward a song change from the audio thread to the UI"""
+        if not self.on_song_change:
+            return
+        if self.dispatch:
+            self.dispatch(lambda: self.on_song_change(song, index))
+        else:
+            self.on_song_change(song, index)
@@ -0,0 +1,135 @@
+"""
+Quarantine
+Remembers song files that failed to load so they are skipped on later plays
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_VERSION = 1
+
+
+class Quarantine:
+    """Persistent set of bad song files, keyed by path and modification time"""
+
+    def __init__(self, quarantine_path: Optional[str] = None):
+        """
+        Initialize quarantine
+
+        Args:
+            quarantine_path: JSON file to persist to, or None to keep it in memory
+        """
+        self.quarantine_path = quarantine_path
+        # Song path -> [mtime_ns, reason, quarantined_at]
+        self.entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load quarantine from file"""
+        if not self.quarantine_path or not os.path.exists(self.quarantine_path):
+            return
+
+        try:
+            with open(self.quarantine_path, 'r') as f:
+                data = json.load(f)
+
+            if data.get('version') != QUARANTINE_VERSION:
+                logger.info("Quarantine version changed, ignoring old file")
+                return
+
+            self.entries = data.get('entries', {})
+            logger.info(f"Quarantine loaded with {len(self.entries)} files")
+        except Exception as e:
+            logger.error(f"Error loading quarantine: {e}")
+            self.entries = {}
+
+    def save(self) -> bool:
+        """Save quarantine to file atomically if it changed"""
+        with self._lock:
+            if not self.quarantine_path or not self._dirty:
+                return True
+
+            data = {'version': QUARANTINE_VERSION, 'entries': self.entries}
+            tmp_path = self.quarantine_path + '.tmp'
+
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.quarantine_path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                logger.error(f"Error saving quarantine: {e}")
+                return False
+
+    def contains(self, path: str) -> bool:
+        """
+        Check whether a song is quarantined
+
+        Entries stop applying once the file is replaced or removed, so fixed
+        files are tried again.
+
+        Args:
+            path: Song path
+
+        Returns:
+            bool: True if the song should be skipped
+        """
+        with self._lock:
+            entry = self.entries.get(path)
+        if entry is None:
+            return False
+
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        if mtime_ns == entry[0]:
+            return True
+
+        with self._lock:
+            self.entries.pop(path, None)
+            self._dirty = True
+        logger.info(f"Released {path} from quarantine, file changed")
+        return False
+
+    def add(self, path: str, reason: str):
+        """
+        Quarantine a song that failed to load
+
+        Args:
+            path: Song path
+            reason: Error message to show in the debug menu
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            # Missing files are left to the library watcher
+            return
+
+        with self._lock:
+            self.entries[path] = [mtime_ns, reason, int(time.time())]
+            self._dirty = True
+        logger.warning(f"Quarantined {path}: {reason}")
+
+    def clear(self):
+        """Release all quarantined songs"""
+        with self._lock:
+            self.entries = {}
+            self._dirty = True
+        self.save()
+
+    def get_entries(self) -> List[tuple]:
+        """Get (path, reason) of quarantined songs, sorted by path"""
+        with self._lock:
+            return sorted((path, entry[1]) for path, entry in self.entries.items())
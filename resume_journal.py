@@ -0,0 +1,186 @@
+"""
+Resume Journal
+Remembers the track and position each NFC tag was left at, with few writes
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResumeJournal:
+    """Append-only journal of per-tag resume positions, batched and compacted"""
+
+    def __init__(self, journal_path: Optional[str], flush_interval: float = 5.0,
+                 compact_after: int = 1000):
+        """
+        Initialize resume journal
+
+        Args:
+            journal_path: JSON lines file to persist to, or None to keep it in memory
+            flush_interval: Seconds between writes; at most this much is lost on power loss
+            compact_after: Superseded lines allowed before the journal is rewritten
+        """
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+
+        # NFC ID -> [track index, position in seconds, song path]
+        self.states: Dict[str, list] = {}
+        self._pending: Dict[str, list] = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.writes = 0
+
+        self.load()
+
+        self._thread = None
+        if journal_path:
+            self._thread = threading.Thread(target=self._run, name='resume-journal', daemon=True)
+            self._thread.start()
+
+    def load(self):
+        """Replay the journal; the last line for a tag wins"""
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return
+
+        torn = False
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.states[record['id']] = [record['track'], record['pos'], record['path']]
+                    except (ValueError, KeyError, TypeError):
+                        # A write cut short by power loss
+                        torn = True
+                        continue
+                    self._lines += 1
+        except Exception as e:
+            logger.error(f"Error loading resume journal: {e}")
+            return
+
+        logger.info(f"Resume journal loaded with {len(self.states)} tags")
+
+        # Appending after a partial line would corrupt the next record too
+        if torn:
+            logger.warning("Resume journal had a damaged line, compacting")
+            self.compact()
+
+    def get(self, nfc_id: str) -> Optional[Tuple[int, float, str]]:
+        """
+        Get where a tag was left
+
+        Args:
+            nfc_id: NFC tag ID
+
+        Returns:
+            tuple: (track index, position in seconds, song path), or None
+        """
+        with self._lock:
+            state = self.states.get(nfc_id)
+        return tuple(state) if state else None
+
+    def record(self, nfc_id: str, index: int, position: float, path: str):
+        """
+        Record the current track and position of a tag
+
+        Only the latest state per tag is written at the next flush.
+
+        Args:
+            nfc_id: NFC tag ID
+            index: Track index in the tag's playlist
+            position: Position in the track in seconds
+            path: Song path, to find the track again if the playlist changed
+        """
+        state = [index, round(position, 1), path]
+        with self._lock:
+            if self.states.get(nfc_id) == state:
+                return
+            self.states[nfc_id] = state
+            self._pending[nfc_id] = state
+
+    def flush(self) -> bool:
+        """Append pending states to the journal and sync them to disk"""
+        with self._lock:
+            if not self.journal_path or not self._pending:
+                return True
+
+            lines = ''.join(
+                json.dumps({'id': nfc_id, 'track': state[0], 'pos': state[1], 'path': state[2]}) + '\n'
+                for nfc_id, state in self._pending.items()
+            )
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                logger.error(f"Error writing resume journal: {e}")
+                return False
+
+            self._lines += len(self._pending)
+            self._pending = {}
+            self.writes += 1
+            needs_compaction = self._lines - len(self.states) > self.compact_after
+
+        if needs_compaction:
+            return self.compact()
+        return True
+
+    def compact(self) -> bool:
+        """Rewrite the journal with one line per tag"""
+        with self._lock:
+            if not self.journal_path:
+                return True
+
+            tmp_path = self.journal_path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for nfc_id, state in self.states.items():
+                        f.write(json.dumps({'id': nfc_id, 'track': state[0],
+                                            'pos': state[1], 'path': state[2]}) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal_path)
+                _fsync_dir(os.path.dirname(os.path.abspath(self.journal_path)))
+            except Exception as e:
+                logger.error(f"Error compacting resume journal: {e}")
+                return False
+
+            self._lines = len(self.states)
+            self._pending = {}
+            self.writes += 1
+            logger.info(f"Resume journal compacted to {self._lines} tags")
+            return True
+
+    def close(self):
+        """Stop the flush thread and write pending states"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        """Flush pending states periodically"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+def _fsync_dir(path: str):
+    """Make a rename in a directory durable"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -2,10 +2,35 @@
 RFID Reader Module for MFRC522
 Handles NFC tag reading on Raspberry Pi
 """
+import time
+import json
+import queue
 import logging
+import threading
+from collections import deque, namedtuple
+from typing import Callable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Seconds between reads by the reader thread, fast after activity and slow when idle
+FAST_POLL_INTERVAL = 0.1
+SLOW_POLL_INTERVAL = 1.0
+# Tag events kept for the UI; the oldest are dropped when it falls behind
+EVENT_QUEUE_SIZE = 16
+# Longest pause between reads after repeated errors
+MAX_ERROR_BACKOFF = 5.0
+
+TAG_ARRIVED = 'arrived'
+TAG_REMOVED = 'removed'
+
+# read_at is the monotonic time of the read that caused the event
+TagEvent = namedtuple('TagEvent', ['kind', 'tag_id', 'read_at'])
+
+# Where SimpleMFRC522 keeps a tag's text: data blocks of sector 2 and its trailer
+DATA_KEY = [0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF]
+DATA_BLOCKS = [8, 9, 10]
+DATA_TRAILER_BLOCK = 11
+
 try:
     from mfrc522 import SimpleMFRC522
     import RPi.GPIO as GPIO
@@ -15,27 +40,334 @@ except ImportError:
     logger.warning("RFID libraries not available. Running in mock mode.")
 
 
+def uid_to_number(uid: List[int]) -> int:
+    """Convert the UID bytes and check byte to the number SimpleMFRC522 reports as tag ID"""
+    number = 0
+    for byte in uid[:5]:
+        number = number * 256 + byte
+    return number
+
+
+class MockMFRC522:
+    """
+    Stand-in for the MFRC522 chip interface, for testing without hardware
+    
+    Methods mirror mfrc522.MFRC522. A tag resting on a real reader answers
+    only every other idle request after an anticollision, and so does this one.
+    """
+    
+    PICC_REQIDL = 0x26
+    PICC_AUTHENT1A = 0x60
+    MI_OK = 0
+    MI_NOTAGERR = 1
+    MI_ERR = 2
+    
+    def __init__(self):
+        """Initialize mock reader with no tag present"""
+        self.uid: Optional[List[int]] = None
+        self.blocks = {}
+        self.commands = 0
+        self._ready = False
+        self._authenticated = False
+    
+    def place_tag(self, tag_id: int, text: str = ''):
+        """
+        Put a tag on the reader
+        
+        Args:
+            tag_id: Tag ID as reported by SimpleMFRC522
+            text: Text stored on the tag
+        """
+        self.uid = [(tag_id >> (8 * (4 - i))) & 0xFF for i in range(5)]
+        data = text.ljust(16 * len(DATA_BLOCKS)).encode('ascii')
+        self.blocks = {block: list(data[i * 16:(i + 1) * 16])
+                       for i, block in enumerate(DATA_BLOCKS)}
+        self._ready = False
+    
+    def remove_tag(self):
+        """Take the tag off the reader"""
+        self.uid = None
+        self.blocks = {}
+    
+    def MFRC522_Request(self, req_mode):
+        self.commands += 1
+        if self.uid is None:
+            return self.MI_NOTAGERR, None
+        if self._ready:
+            self._ready = False
+            return self.MI_NOTAGERR, None
+        return self.MI_OK, 0x10
+    
+    def MFRC522_Anticoll(self):
+        self.commands += 1
+        if self.uid is None:
+            return self.MI_ERR, []
+        self._ready = True
+        return self.MI_OK, list(self.uid)
+    
+    def MFRC522_SelectTag(self, uid):
+        self.commands += 1
+        return 0x08 if self.uid is not None else 0
+    
+    def MFRC522_Auth(self, auth_mode, block_addr, key, uid):
+        self.commands += 1
+        self._authenticated = self.uid is not None and key == DATA_KEY
+        return self.MI_OK if self._authenticated else self.MI_ERR
+    
+    def MFRC522_Read(self, block_addr):
+        self.commands += 1
+        if not self._authenticated:
+            return None
+        return list(self.blocks.get(block_addr, [0] * 16))
+    
+    def MFRC522_StopCrypto1(self):
+        self.commands += 1
+        self._authenticated = False
+
+
+def load_trace(trace_path: str) -> List[Tuple[float, str, int]]:
+    """
+    Load a tag trace for ReplayMFRC522
+    
+    Each line is a JSON object like {"t": 12.5, "action": "place", "tag": 123456789},
+    where t is seconds from the start and action is "place" or "remove".
+    
+    Args:
+        trace_path: JSON lines file
+    
+    Returns:
+        list: (seconds, action, tag ID) steps
+    """
+    steps = []
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                step = json.loads(line)
+                steps.append((float(step['t']), step['action'], int(step.get('tag') or 0)))
+    return steps
+
+
+class ReplayMFRC522(MockMFRC522):
+    """MockMFRC522 that places and removes tags following a trace"""
+    
+    def __init__(self, trace: List[Tuple[float, str, int]], speed: float = 1.0,
+                 loop: bool = False):
+        """
+        Initialize replay reader
+        
+        The trace starts at the first request.
+        
+        Args:
+            trace: (seconds, action, tag ID) steps; action is "place" or "remove"
+            speed: Replay speed; 2.0 replays a trace in half its time
+            loop: Start the trace over when it ends
+        """
+        super().__init__()
+        self.trace = sorted(trace, key=lambda step: step[0])
+        self.speed = speed
+        self.loop = loop
+        self.steps_replayed = 0
+        # Called with (action, tag ID, monotonic time the step was due) as it is replayed
+        self.on_step: Optional[Callable[[str, int, float], None]] = None
+        self._position = 0
+        self._start_time: Optional[float] = None
+    
+    @property
+    def finished(self) -> bool:
+        """Whether every step was replayed"""
+        return not self.loop and self._position >= len(self.trace)
+    
+    def MFRC522_Request(self, req_mode):
+        self._advance(time.monotonic())
+        return super().MFRC522_Request(req_mode)
+    
+    def _advance(self, now: float):
+        """Apply the steps that are due"""
+        if self._start_time is None:
+            self._start_time = now
+        
+        while self.trace:
+            if self._position >= len(self.trace):
+                if not self.loop or self.trace[-1][0] <= 0:
+                    return
+                # Run the trace again from where the last pass ended
+                self._start_time += self.trace[-1][0] / self.speed
+                self._position = 0
+            
+            seconds, action, tag_id = self.trace[self._position]
+            due = self._start_time + seconds / self.speed
+            if due > now:
+                return
+            
+            if action == 'place':
+                self.place_tag(tag_id)
+            elif action == 'remove':
+                self.remove_tag()
+            self._position += 1
+            self.steps_replayed += 1
+            if self.on_step:
+                self.on_step(action, tag_id, due)
+
+
+class TagPresence:
+    """Turns raw reads into tag arrived/removed events"""
+    
+    def __init__(self, removal_grace: float = 1.5, arrival_debounce: float = 0.0):
+        """
+        Initialize presence tracking
+        
+        Args:
+            removal_grace: Seconds a tag may go unread before it counts as
+                removed; the reader misses a resting tag on some reads
+            arrival_debounce: Seconds a tag must be present before it counts
+                as arrived, to ignore tags swiped past the reader
+        """
+        self.removal_grace = removal_grace
+        self.arrival_debounce = arrival_debounce
+        self.present: Optional[str] = None
+        self._candidate: Optional[str] = None
+        self._first_seen = 0.0
+        self._last_seen = 0.0
+    
+    def update(self, tag_id: Optional[str], now: float) -> List[TagEvent]:
+        """
+        Feed the result of one read
+        
+        Args:
+            tag_id: Tag read, or None if no tag was read
+            now: Monotonic time of the read
+        
+        Returns:
+            list: Events caused by this read
+        """
+        events = []
+        
+        if tag_id is None:
+            if now - self._last_seen >= self.removal_grace:
+                if self.present is not None:
+                    events.append(TagEvent(TAG_REMOVED, self.present, now))
+                self.present = None
+                self._candidate = None
+            return events
+        
+        if tag_id != self._candidate:
+            # A different tag replaced the previous one without a gap
+            if self.present is not None:
+                events.append(TagEvent(TAG_REMOVED, self.present, now))
+                self.present = None
+            self._candidate = tag_id
+            self._first_seen = now
+        self._last_seen = now
+        
+        if self.present is None and now - self._first_seen >= self.arrival_debounce:
+            self.present = tag_id
+            events.append(TagEvent(TAG_ARRIVED, tag_id, now))
+        
+        return events
+
+
+class PollSchedule:
+    """Read interval that is short after tag activity and grows while idle"""
+    
+    def __init__(self, fast: float = FAST_POLL_INTERVAL, slow: float = SLOW_POLL_INTERVAL,
+                 idle_after: float = 10.0, decay: float = 1.5):
+        """
+        Initialize poll schedule
+        
+        Args:
+            fast: Seconds between reads right after a tag arrives or is removed
+            slow: Longest seconds between reads when idle
+            idle_after: Seconds of fast reads after the last activity
+            decay: Factor the interval grows by with each idle read
+        """
+        self.fast = fast
+        self.slow = max(fast, slow)
+        self.idle_after = idle_after
+        self.decay = max(1.0, decay)
+        self.interval = fast
+        self._last_activity = float('-inf')
+    
+    def activity(self, now: float):
+        """Go back to fast reads"""
+        self._last_activity = now
+        self.interval = self.fast
+    
+    def next_interval(self, now: float, cap: Optional[float] = None) -> float:
+        """
+        Get the seconds until the next read
+        
+        Args:
+            now: Monotonic time
+            cap: Longest interval allowed right now
+        
+        Returns:
+            float: Seconds to wait
+        """
+        if now - self._last_activity >= self.idle_after:
+            self.interval = min(self.slow, self.interval * self.decay)
+        if cap is not None:
+            return min(self.interval, max(self.fast, cap))
+        return self.interval
+
+
 class RFIDReader:
     """Wrapper for MFRC522 RFID reader"""
     
-    def __init__(self, mock_mode=False):
+    def __init__(self, mock_mode=False, removal_grace: float = 1.5,
+                 arrival_debounce: float = 0.0, poll_schedule: Optional[PollSchedule] = None,
+                 read_data: bool = False, chip=None):
         """
         Initialize RFID reader
         
         Args:
-            mock_mode: If True, use mock reader for testing without hardware
+            mock_mode: If True, use a mock chip instead of the hardware
+            removal_grace: Seconds a tag may go unread before it counts as removed
+            arrival_debounce: Seconds a tag must be present before it counts as arrived
+            poll_schedule: Read intervals of the reader thread (default: PollSchedule())
+            read_data: Also read the text stored on tags (see get_tag_data); each
+                read then authenticates and reads the data blocks, which is slower
+            chip: Mock chip for mock mode, e.g. a ReplayMFRC522 (default: MockMFRC522())
         """
-        self.mock_mode = mock_mode or not RFID_AVAILABLE
+        self.mock_mode = mock_mode or not RFID_AVAILABLE or chip is not None
         self.reader = None
+        # Low-level chip interface used for reads
+        self.chip = None
+        self.read_data = read_data
+        # Tag ID -> text stored on the tag, when read_data is set
+        self.tag_data = {}
+        
+        # Reader thread state
+        self.presence = TagPresence(removal_grace, arrival_debounce)
+        self.poll_schedule = poll_schedule or PollSchedule()
+        self.events: queue.Queue = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.on_event: Optional[Callable[[], None]] = None
+        # Optional LatencyTracker; the read that finds a tag is timed
+        self.latency = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        
+        # Health counters
+        self.reads = 0
+        self.read_errors = 0
+        self.consecutive_errors = 0
+        self.dropped_events = 0
+        self.last_error: Optional[str] = None
+        self.last_read_at: Optional[float] = None
+        # Reader thread wakeups in the last minute
+        self._wakeups: deque = deque()
         
         if not self.mock_mode:
             try:
                 self.reader = SimpleMFRC522()
+                self.chip = self.reader.READER
                 logger.info("RFID reader initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize RFID reader: {e}")
                 logger.info("Falling back to mock mode")
                 self.mock_mode = True
+        
+        if self.mock_mode:
+            self.chip = chip or MockMFRC522()
     
     def read_id(self, timeout=None):
         """
@@ -47,22 +379,203 @@ class RFIDReader:
         Returns:
             str: Tag ID as string, or None if no tag detected
         """
-        if self.mock_mode:
-            # Mock mode for testing without hardware
-            logger.info("Mock mode: Simulating NFC read")
-            return None
-        
         try:
-            id, text = self.reader.read_no_block()
-            if id:
-                tag_id = str(id)
+            tag_id = self._read_tag()
+            if tag_id:
                 logger.info(f"NFC tag detected: {tag_id}")
-                return tag_id
-            return None
+            return tag_id
         except Exception as e:
             logger.error(f"Error reading NFC tag: {e}")
             return None
     
+    def start(self, on_event: Optional[Callable[[], None]] = None):
+        """
+        Start the reader thread
+        
+        TagEvents are put on the events queue when a tag arrives or is
+        removed; a tag resting on the reader produces no further events.
+        on_event is called from the reader thread after each new event,
+        e.g. to schedule draining the queue on the UI thread.
+        
+        Args:
+            on_event: Optional callback for new events
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self.on_event = on_event
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rfid', daemon=True)
+        self._thread.start()
+        logger.info("RFID reader thread started")
+    
+    def stop(self, timeout: float = 2.0):
+        """
+        Stop the reader thread
+        
+        Args:
+            timeout: Seconds to wait for a read in progress to finish
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.warning("RFID reader thread did not stop, read may be hung")
+            self._thread = None
+    
+    def get_events(self) -> List[TagEvent]:
+        """Take all pending tag events off the queue"""
+        events = []
+        try:
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+    
+    def get_tag_data(self, tag_id: str) -> Optional[str]:
+        """
+        Get the text stored on a tag
+        
+        Args:
+            tag_id: Tag ID
+        
+        Returns:
+            str: Text from the tag's last read, or None if read_data is off or
+                the tag was not read yet
+        """
+        return self.tag_data.get(tag_id)
+    
+    def get_health(self) -> dict:
+        """
+        Get reader thread health
+        
+        Returns:
+            dict: Read and error counters, the last error, and the seconds
+                since the last completed read (large if a read is hung)
+        """
+        now = time.monotonic()
+        since_read = None
+        if self.last_read_at is not None:
+            since_read = round(now - self.last_read_at, 1)
+        
+        # Copy first, the reader thread appends concurrently
+        wakeups = sum(1 for t in list(self._wakeups) if now - t < 60.0)
+        
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'reads': self.reads,
+            'read_errors': self.read_errors,
+            'consecutive_errors': self.consecutive_errors,
+            'dropped_events': self.dropped_events,
+            'last_error': self.last_error,
+            'seconds_since_read': since_read,
+            'poll_interval': round(self.poll_schedule.interval, 2),
+            'wakeups_per_minute': wakeups
+        }
+    
+    def _run(self):
+        """Read tags until stopped, slowing down while idle or while reads keep failing"""
+        schedule = self.poll_schedule
+        while not self._stop.is_set():
+            try:
+                started = time.monotonic()
+                tag_id = self._read_tag()
+                self.consecutive_errors = 0
+                now = time.monotonic()
+                # Failed reads say nothing about presence, so only successful ones count
+                for event in self.presence.update(tag_id, now):
+                    logger.info(f"NFC tag {event.kind}: {event.tag_id}")
+                    schedule.activity(now)
+                    if self.latency and event.kind == TAG_ARRIVED:
+                        self.latency.record('rfid_read', now - started)
+                    self._put_event(event)
+                if tag_id is not None and tag_id != self.presence.present:
+                    # Arrival still debouncing
+                    schedule.activity(now)
+                
+                # A resting tag must be read often enough not to count as removed
+                cap = None
+                if self.presence.present is not None:
+                    cap = self.presence.removal_grace / 3
+                delay = schedule.next_interval(now, cap)
+            except Exception as e:
+                self.read_errors += 1
+                self.consecutive_errors += 1
+                self.last_error = str(e)
+                delay = min(MAX_ERROR_BACKOFF, schedule.slow * 2 ** self.consecutive_errors)
+                logger.error(f"Error reading NFC tag ({self.consecutive_errors} in a row): {e}")
+            
+            self.reads += 1
+            self.last_read_at = time.monotonic()
+            self._wakeups.append(self.last_read_at)
+            while self._wakeups and self.last_read_at - self._wakeups[0] >= 60.0:
+                self._wakeups.popleft()
+            self._stop.wait(delay)
+    
+    def _put_event(self, event):
+        """Queue an event, dropping the oldest one if the UI fell behind"""
+        while True:
+            try:
+                self.events.put_nowait(event)
+                break
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped_events += 1
+                except queue.Empty:
+                    pass
+        
+        if self.on_event:
+            try:
+                self.on_event()
+            except Exception as e:
+                logger.error(f"Error in RFID event callback: {e}")
+    
+    def _read_tag(self) -> Optional[str]:
+        """
+        Read a tag ID once
+        
+        Only the request and anticollision commands are sent, which return
+        the UID without authenticating; the data blocks are read as well if
+        read_data is set.
+        
+        Returns:
+            str: Tag ID, or None if no tag is present
+        
+        Raises:
+            Exception: If the reader fails
+        """
+        chip = self.chip
+        status, _ = chip.MFRC522_Request(chip.PICC_REQIDL)
+        if status != chip.MI_OK:
+            return None
+        status, uid = chip.MFRC522_Anticoll()
+        if status != chip.MI_OK:
+            return None
+        
+        tag_id = str(uid_to_number(uid))
+        if self.read_data:
+            text = self._read_tag_data(uid)
+            if text is not None:
+                self.tag_data[tag_id] = text
+        return tag_id
+    
+    def _read_tag_data(self, uid: List[int]) -> Optional[str]:
+        """Read the text of the tag just found, as SimpleMFRC522 stores it"""
+        chip = self.chip
+        chip.MFRC522_SelectTag(uid)
+        try:
+            status = chip.MFRC522_Auth(chip.PICC_AUTHENT1A, DATA_TRAILER_BLOCK, DATA_KEY, uid)
+            if status != chip.MI_OK:
+                return None
+            data = []
+            for block in DATA_BLOCKS:
+                data += chip.MFRC522_Read(block) or []
+            return ''.join(chr(byte) for byte in data).rstrip()
+        finally:
+            chip.MFRC522_StopCrypto1()
+    
     def read_id_blocking(self):
         """
         Read NFC tag ID (blocking until tag is detected)
@@ -75,7 +588,11 @@ class RFIDReader:
             return "mock_tag_123456"
         
         try:
-            id, text = self.reader.read()
+            if self.read_data:
+                id, text = self.reader.read()
+                self.tag_data[str(id)] = text.rstrip()
+            else:
+                id = self.reader.read_id()
             tag_id = str(id)
             logger.info(f"NFC tag detected (blocking): {tag_id}")
             return tag_id
@@ -84,7 +601,8 @@ class RFIDReader:
             return None
     
     def cleanup(self):
-        """Clean up GPIO resources"""
+        """Stop the reader thread and clean up GPIO resources"""
+        self.stop()
         if not self.mock_mode and RFID_AVAILABLE:
             try:
                 GPIO.cleanup()
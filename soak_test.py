@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Soak Test
+Replays tag taps into the whole jukebox app and tracks resource use over time
+
+Usage:
+    python soak_test.py --duration 14400               # random taps for four hours
+    python soak_test.py --trace taps.jsonl --speed 10  # replay a trace ten times faster
+    python soak_test.py --output soak.jsonl            # write samples to a file
+
+Audio and pygame video use SDL's dummy drivers. Tk still needs a display;
+on a headless machine run the test under xvfb-run.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+# Must be set before the app imports pygame
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+import tkinter as tk
+
+from config_manager import ConfigManager
+from jukebox_app import JukeboxApp
+from rfid_reader import ReplayMFRC522, load_trace
+
+logger = logging.getLogger(__name__)
+
+
+def random_trace(tags: List[int], stop_tag: Optional[int], taps: int, seed: Optional[int] = None,
+                 mean_hold: float = 20.0, mean_gap: float = 10.0,
+                 stop_share: float = 0.1, unknown_share: float = 0.1) -> List[tuple]:
+    """
+    Generate a trace of a child placing and lifting figures
+
+    Args:
+        tags: Tag IDs with a playlist
+        stop_tag: Tag ID of the stop tag, or None
+        taps: Number of placements
+        seed: Random seed, for repeatable traces
+        mean_hold: Mean seconds a figure stays on the reader
+        mean_gap: Mean seconds between lifting a figure and placing the next
+        stop_share: Share of placements that are the stop tag
+        unknown_share: Share of placements that are tags without a playlist
+
+    Returns:
+        list: (seconds, action, tag ID) steps for ReplayMFRC522
+    """
+    rng = random.Random(seed)
+    steps = []
+    t = 0.0
+    for _ in range(taps):
+        choice = rng.random()
+        if stop_tag is not None and choice < stop_share:
+            tag_id = stop_tag
+        elif choice < stop_share + unknown_share or not tags:
+            tag_id = rng.randrange(10 ** 9, 10 ** 12)
+        else:
+            tag_id = rng.choice(tags)
+
+        t += rng.expovariate(1.0 / mean_gap)
+        steps.append((round(t, 2), 'place', tag_id))
+        t += rng.expovariate(1.0 / mean_hold)
+        steps.append((round(t, 2), 'remove', tag_id))
+    return steps
+
+
+def library_tags(library_path: str) -> List[int]:
+    """Get the playlist folder names that a tag can read as"""
+    try:
+        names = os.listdir(library_path)
+    except OSError:
+        return []
+    # Tag IDs are numbers without leading zeros
+    return sorted(int(name) for name in names if name.isdigit() and str(int(name)) == name)
+
+
+def read_rss_kb() -> int:
+    """Current resident set size in kB, or the peak where /proc is missing"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def summarize(values: List[float]) -> Optional[dict]:
+    """p50/p95/max of latencies in milliseconds"""
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': round(values[len(values) // 2], 1),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+        'max': round(values[-1], 1)
+    }
+
+
+class SoakMonitor:
+    """Samples threads, memory, Tk images and tag handling latency of a running app"""
+
+    def __init__(self, app: JukeboxApp, chip: ReplayMFRC522, sample_interval: float, output):
+        """
+        Initialize monitor
+
+        Args:
+            app: App under test
+            chip: Replay reader feeding the app
+            sample_interval: Seconds between samples
+            output: File to write one JSON sample per line to
+        """
+        self.app = app
+        self.chip = chip
+        self.sample_interval = sample_interval
+        self.output = output
+        self.samples = []
+        self.started = time.monotonic()
+
+        # Latencies since the last sample, in milliseconds
+        self._handler_ms = []
+        self._tap_ms = []
+        # Tag ID -> monotonic time its placement was due; written by the reader thread
+        self._placed = {}
+        self._next_sample = None
+
+        chip.on_step = self._step_replayed
+        self._wrap_handler('handle_nfc_tag')
+        self._wrap_handler('handle_tag_removed')
+
+    def start(self):
+        """Take a first sample and keep sampling"""
+        self._next_sample = time.monotonic()
+        self._sample()
+
+    def summary(self) -> dict:
+        """Compare the first and last samples"""
+        if not self.samples:
+            return {}
+        first, last = self.samples[0], self.samples[-1]
+        return {
+            'elapsed_s': last['elapsed_s'],
+            'taps': last['steps_replayed'],
+            'threads': [first['threads'], last['threads'], max(s['threads'] for s in self.samples)],
+            'rss_kb': [first['rss_kb'], last['rss_kb'], max(s['rss_kb'] for s in self.samples)],
+            'tk_images': [first['tk_images'], last['tk_images'], max(s['tk_images'] for s in self.samples)],
+            'max_ui_lag_ms': max(s['ui_lag_ms'] for s in self.samples)
+        }
+
+    def _wrap_handler(self, name: str):
+        """Time an app handler each time it runs"""
+        handler = getattr(self.app, name)
+
+        def timed(nfc_id, *args):
+            start = time.monotonic()
+            placed = self._placed.pop(nfc_id, None) if name == 'handle_nfc_tag' else None
+            try:
+                return handler(nfc_id, *args)
+            finally:
+                self._handler_ms.append((time.monotonic() - start) * 1000)
+                if placed is not None:
+                    self._tap_ms.append((start - placed) * 1000)
+
+        setattr(self.app, name, timed)
+
+    def _step_replayed(self, action: str, tag_id: int, due: float):
+        """Note when a figure was placed, to measure how long the app took to react"""
+        if action == 'place':
+            self._placed[str(tag_id)] = due
+
+    def _sample(self):
+        """Record one sample and schedule the next"""
+        now = time.monotonic()
+        ui_lag_ms = (now - self._next_sample) * 1000
+        health = self.app.rfid_reader.get_health()
+        names = Counter(re.sub(r'\d+', 'N', t.name) for t in threading.enumerate())
+
+        sample = {
+            'elapsed_s': round(now - self.started, 1),
+            'steps_replayed': self.chip.steps_replayed,
+            'threads': threading.active_count(),
+            'thread_names': dict(names),
+            'rss_kb': read_rss_kb(),
+            'tk_images': len(self.app.root.image_names()),
+            'handler_ms': summarize(self._handler_ms),
+            'tap_to_handler_ms': summarize(self._tap_ms),
+            'ui_lag_ms': round(max(0.0, ui_lag_ms), 1),
+            'rfid_wakeups_per_minute': health['wakeups_per_minute'],
+            'rfid_dropped_events': health['dropped_events']
+        }
+        self._handler_ms = []
+        self._tap_ms = []
+        self.samples.append(sample)
+        self.output.write(json.dumps(sample) + '\n')
+        self.output.flush()
+
+        self._next_sample += self.sample_interval
+        delay = max(0.0, self._next_sample - time.monotonic())
+        self.app.root.after(int(delay * 1000), self._sample)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Replay tag taps into the jukebox and watch for leaks")
+    parser.add_argument('--duration', type=float, default=3600,
+                        help="Seconds to run (default: 3600)")
+    parser.add_argument('--trace', help="JSON lines trace to replay instead of random taps")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed; 10 replays a trace ten times faster (default: 1)")
+    parser.add_argument('--taps', type=int, default=200,
+                        help="Placements in a random trace, which then repeats (default: 200)")
+    parser.add_argument('--seed', type=int, help="Random seed for a repeatable trace")
+    parser.add_argument('--mean-hold', type=float, default=20.0,
+                        help="Mean seconds a figure rests on the reader (default: 20)")
+    parser.add_argument('--mean-gap', type=float, default=10.0,
+                        help="Mean seconds between figures (default: 10)")
+    parser.add_argument('--sample-interval', type=float, default=60.0,
+                        help="Seconds between samples (default: 60)")
+    parser.add_argument('--config', default='config.json', help="Config file (default: config.json)")
+    parser.add_argument('--output', help="Write JSON samples to this file instead of stdout")
+    parser.add_argument('--log-level', default='WARNING', help="App log level (default: WARNING)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.trace:
+        trace = load_trace(args.trace)
+        loop = False
+    else:
+        config = ConfigManager(args.config)
+        stop_tag = config.get('stop_nfc_id')
+        trace = random_trace(
+            library_tags(config.get_music_library_path()),
+            int(stop_tag) if stop_tag and str(stop_tag).isdigit() else None,
+            args.taps, args.seed, args.mean_hold, args.mean_gap
+        )
+        loop = True
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    chip = ReplayMFRC522(trace, speed=args.speed, loop=loop)
+
+    root = tk.Tk()
+    app = JukeboxApp(root, rfid_chip=chip, config_file=args.config)
+    monitor = SoakMonitor(app, chip, args.sample_interval, output)
+
+    def finish():
+        app.cleanup()
+        root.destroy()
+
+    monitor.start()
+    root.after(int(args.duration * 1000), finish)
+    try:
+        root.mainloop()
+    except KeyboardInterrupt:
+        finish()
+
+    print(json.dumps({'summary': monitor.summary()}), file=sys.stderr)
+    if output is not sys.stdout:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
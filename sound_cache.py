@@ -0,0 +1,134 @@
+"""
+Sound Cache
+Keeps short tracks decoded in memory so repeat plays start without disk I/O
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import pygame
+
+from audio_metadata import read_audio_info
+
+logger = logging.getLogger(__name__)
+
+# Paths remembered as not playable from memory; the oldest are forgotten beyond this
+MAX_SKIPPED = 4096
+
+
+class SoundCache:
+    """Memory-budgeted LRU of decoded pygame Sounds for short tracks"""
+
+    def __init__(self, budget_bytes: int, max_duration: float = 30.0):
+        """
+        Initialize sound cache
+
+        Args:
+            budget_bytes: Maximum total size of decoded audio kept in memory
+            max_duration: Tracks longer than this many seconds are not cached
+        """
+        self.budget_bytes = budget_bytes
+        self.max_duration = max_duration
+
+        # Song path -> (Sound, decoded size), least recently used first
+        self._sounds: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        # Paths known to be too long or undecodable, oldest first
+        self._skipped: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_eligible(self, path: str, duration: Optional[float] = None) -> bool:
+        """
+        Check whether a track is short enough to be played from memory
+
+        Args:
+            path: Song path
+            duration: Duration in seconds if already known; read from the
+                file headers otherwise
+
+        Returns:
+            bool: True if the track should be played as a Sound
+        """
+        if path in self._sounds:
+            return True
+        if path in self._skipped:
+            return False
+
+        if duration is None:
+            try:
+                info = read_audio_info(path)
+                duration = info.duration if info else None
+            except Exception as e:
+                logger.warning(f"Could not read duration of {path}: {e}")
+
+        if not duration or duration > self.max_duration or \
+                self._decoded_size(duration) > self.budget_bytes:
+            self._skip(path)
+            return False
+        return True
+
+    def get(self, path: str, load_path: Optional[str] = None) -> Optional[pygame.mixer.Sound]:
+        """
+        Get the decoded Sound for a track, decoding it on a miss
+
+        Args:
+            path: Song path, used as the cache key
+            load_path: File to decode, e.g. a staged local copy (default: path)
+
+        Returns:
+            Sound: Decoded track, or None if it could not be decoded
+        """
+        with self._lock:
+            cached = self._sounds.get(path)
+            if cached:
+                self._sounds.move_to_end(path)
+                self.hits += 1
+                return cached[0]
+
+        self.misses += 1
+        try:
+            sound = pygame.mixer.Sound(load_path or path)
+        except (pygame.error, FileNotFoundError) as e:
+            logger.warning(f"Could not decode {os.path.basename(path)}: {e}")
+            self._skip(path)
+            return None
+
+        size = self._decoded_size(sound.get_length())
+        with self._lock:
+            if path not in self._sounds:
+                self._sounds[path] = (sound, size)
+                self._total_bytes += size
+            self._evict()
+
+        logger.info(f"Decoded {os.path.basename(path)} into memory ({size} bytes)")
+        return sound
+
+    def clear(self):
+        """Drop all decoded sounds"""
+        with self._lock:
+            self._sounds.clear()
+            self._skipped.clear()
+            self._total_bytes = 0
+
+    def _skip(self, path: str):
+        """Remember a path as not playable from memory"""
+        with self._lock:
+            self._skipped[path] = None
+            while len(self._skipped) > MAX_SKIPPED:
+                self._skipped.popitem(last=False)
+
+    def _evict(self):
+        """Drop least recently used sounds until the budget is met (call with the lock held)"""
+        while self._total_bytes > self.budget_bytes and len(self._sounds) > 1:
+            _, (_, size) = self._sounds.popitem(last=False)
+            self._total_bytes -= size
+
+    @staticmethod
+    def _decoded_size(duration: float) -> int:
+        """Bytes of mixer-format audio needed for a duration"""
+        frequency, size, channels = pygame.mixer.get_init() or (44100, -16, 2)
+        return int(duration * frequency * channels * abs(size) // 8)
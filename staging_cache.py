@@ -0,0 +1,247 @@
+"""
+Staging Cache
+Copies upcoming tracks from slow or network storage to fast local storage
+"""
+import hashlib
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+
+class StagingCache:
+    """Byte-budgeted LRU of local copies of the current and upcoming tracks"""
+
+    def __init__(self, cache_dir: str, budget_bytes: int, lookahead: int = 2,
+                 open_source: Callable = open):
+        """
+        Initialize staging cache
+
+        Args:
+            cache_dir: Local directory for staged copies (tmpfs or SD card)
+            budget_bytes: Maximum total size of staged copies
+            lookahead: Number of tracks after the current one the player stages
+            open_source: Function used to open source files for reading; tests
+                can pass a throttled opener to stand in for a slow mount
+        """
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.lookahead = lookahead
+        self.open_source = open_source
+
+        # Staged file name -> size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # Source path -> (staged file name, source size, source mtime_ns), for
+        # copies that are complete
+        self._ready: Dict[str, tuple] = {}
+
+        self._wanted: List[str] = []
+        self._condition = threading.Condition()
+        self._running = True
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+        self._thread = threading.Thread(target=self._worker, name='staging', daemon=True)
+        self._thread.start()
+
+    def get_path(self, source_path: str) -> str:
+        """
+        Get the path to play a track from
+
+        Args:
+            source_path: Path of the track in the music library
+
+        Returns:
+            str: Staged copy if it is ready and the source is unchanged since
+                it was copied, otherwise the source path
+        """
+        with self._condition:
+            staged = self._ready.get(source_path)
+
+        if staged is not None and not self._unchanged(source_path, staged):
+            logger.info(f"{os.path.basename(source_path)} changed since it was staged")
+            self._forget(source_path, staged)
+            staged = None
+
+        with self._condition:
+            if staged is None or self._ready.get(source_path) != staged:
+                self.misses += 1
+                return source_path
+
+            self.hits += 1
+            self._files.move_to_end(staged[0])
+            return os.path.join(self.cache_dir, staged[0])
+
+    def stage(self, paths: List[str]):
+        """
+        Stage tracks in the given order, replacing earlier requests
+
+        Copies of tracks that are no longer wanted are abandoned mid-copy, so
+        a new tag tap doesn't wait behind the previous playlist.
+
+        Args:
+            paths: Current track followed by the upcoming ones
+        """
+        with self._condition:
+            self._wanted = list(paths)
+            self._condition.notify()
+
+    def close(self):
+        """Stop the staging thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=2.0)
+
+    def _load_existing(self):
+        """Adopt copies left by a previous run; their names identify path, size and mtime"""
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.is_file()]
+        except OSError as e:
+            logger.error(f"Error reading staging cache: {e}")
+            return
+
+        for entry in sorted(entries, key=lambda e: e.stat().st_atime):
+            if entry.name.endswith('.part'):
+                os.remove(entry.path)
+                continue
+            size = entry.stat().st_size
+            self._files[entry.name] = size
+            self._total_bytes += size
+
+        self._evict(0, set())
+        logger.info(f"Staging cache holds {len(self._files)} files ({self._total_bytes} bytes)")
+
+    @staticmethod
+    def _unchanged(source_path: str, staged: tuple) -> bool:
+        """Check that a source still has the size and mtime it was staged with"""
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == staged[1:]
+
+    def _forget(self, source_path: str, staged: tuple):
+        """Drop a stale copy so the worker stages the track again if it is wanted"""
+        with self._condition:
+            if self._ready.get(source_path) != staged:
+                return
+            del self._ready[source_path]
+            self._remove(staged[0])
+            self._condition.notify()
+
+    @staticmethod
+    def _staged_name(source_path: str, st: os.stat_result) -> str:
+        """Name a staged copy after the source path, size and mtime"""
+        key = f"{os.path.abspath(source_path)}\0{st.st_size}\0{st.st_mtime_ns}"
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+        return digest + os.path.splitext(source_path)[1].lower()
+
+    def _worker(self):
+        """Copy wanted tracks in order, restarting when the wanted list changes"""
+        while True:
+            with self._condition:
+                while self._running and not self._next_wanted():
+                    self._condition.wait()
+                if not self._running:
+                    return
+                source_path = self._next_wanted()
+
+            try:
+                self._stage_file(source_path)
+            except Exception as e:
+                logger.warning(f"Could not stage {source_path}: {e}")
+                with self._condition:
+                    # Don't retry until it is requested again
+                    if source_path in self._wanted:
+                        self._wanted.remove(source_path)
+
+    def _next_wanted(self) -> Optional[str]:
+        """First wanted track without a ready copy (call with the lock held)"""
+        for path in self._wanted:
+            if path not in self._ready:
+                return path
+        return None
+
+    def _stage_file(self, source_path: str):
+        """Copy one track into the cache unless an identical copy exists"""
+        st = os.stat(source_path)
+        name = self._staged_name(source_path, st)
+        if st.st_size > self.budget_bytes:
+            raise ValueError("file is larger than the staging budget")
+
+        staged = (name, st.st_size, st.st_mtime_ns)
+
+        with self._condition:
+            if name in self._files:
+                self._ready[source_path] = staged
+                self._files.move_to_end(name)
+                return
+            pinned = {self._ready[p][0] for p in self._wanted if p in self._ready}
+            if not self._evict(st.st_size, pinned):
+                raise ValueError("staging budget is taken by pinned tracks")
+
+        staged_path = os.path.join(self.cache_dir, name)
+        part_path = staged_path + '.part'
+
+        copied = 0
+        complete = False
+        with self.open_source(source_path, 'rb') as src, open(part_path, 'wb') as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    complete = True
+                    break
+                dst.write(chunk)
+                copied += len(chunk)
+
+                # A new tap may have made this copy pointless
+                with self._condition:
+                    if not self._running or source_path not in self._wanted:
+                        break
+
+        with self._condition:
+            # The track may be wanted again by now, but an abandoned copy is truncated
+            if not complete or copied != st.st_size or \
+                    not self._running or source_path not in self._wanted:
+                os.remove(part_path)
+                return
+            os.replace(part_path, staged_path)
+            self._files[name] = st.st_size
+            self._total_bytes += st.st_size
+            self._ready[source_path] = staged
+
+        logger.info(f"Staged {os.path.basename(source_path)} ({st.st_size} bytes)")
+
+    def _evict(self, needed: int, pinned: set) -> bool:
+        """Remove least recently used copies until needed bytes fit (call with the lock held)"""
+        for name in list(self._files):
+            if self._total_bytes + needed <= self.budget_bytes:
+                break
+            if name in pinned:
+                continue
+            self._remove(name)
+
+        return self._total_bytes + needed <= self.budget_bytes
+
+    def _remove(self, name: str):
+        """Delete a staged copy and forget the sources it served (call with the lock held)"""
+        size = self._files.pop(name, None)
+        if size is None:
+            return
+        self._total_bytes -= size
+        for source_path in [p for p, staged in self._ready.items() if staged[0] == name]:
+            del self._ready[source_path]
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError as e:
+            logger.warning(f"Could not remove staged file {name}: {e}")
@@ -0,0 +1,324 @@
+"""
+Transcode Cache
+Converts costly or unsupported audio formats into cheap-to-decode copies in the background
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Union
+
+from job_runner import ProcessJobRunner
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+KEY_PATTERN = re.compile(r'[0-9a-f]{40}')
+
+# Encoder presets: command with {input}/{output} placeholders and output extension
+ENCODER_PRESETS = {
+    'ffmpeg-vorbis': (['ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', '{input}',
+                       '-vn', '-c:a', 'libvorbis', '-q:a', '4', '{output}'], '.ogg'),
+    'ffmpeg-mp3': (['ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', '{input}',
+                    '-vn', '-c:a', 'libmp3lame', '-q:a', '4', '{output}'], '.mp3'),
+    'oggenc': (['oggenc', '-Q', '-q', '4', '-o', '{output}', '{input}'], '.ogg'),
+    'flac-to-wav': (['flac', '-d', '-s', '-f', '-o', '{output}', '{input}'], '.wav'),
+}
+
+
+class CommandEncoder:
+    """Encodes a file by running an external command"""
+
+    def __init__(self, command: List[str], extension: str, timeout: float = 600.0):
+        """
+        Initialize encoder
+
+        Args:
+            command: Program and arguments; {input} and {output} are replaced
+                with the source and destination paths
+            extension: Extension of the files the command writes, e.g. ".ogg"
+            timeout: Seconds one file may take before it is given up
+        """
+        self.command = list(command)
+        self.extension = extension
+        self.timeout = timeout
+
+    @property
+    def signature(self) -> str:
+        """Identifies the encoder settings; part of every cache key"""
+        return ' '.join(self.command) + self.extension
+
+    def available(self) -> bool:
+        """Check whether the encoder program is installed"""
+        return shutil.which(self.command[0]) is not None
+
+    def encode(self, source_path: str, output_path: str):
+        """
+        Encode one file
+
+        Raises:
+            subprocess.CalledProcessError: If the command fails
+            subprocess.TimeoutExpired: If the command takes too long
+        """
+        args = [arg.replace('{input}', source_path).replace('{output}', output_path)
+                for arg in self.command]
+        subprocess.run(args, check=True, stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       timeout=self.timeout)
+
+
+def make_encoder(spec: Union[str, dict]) -> CommandEncoder:
+    """
+    Create an encoder from a preset name or a {"command": [...], "extension": ".ogg"} dict
+
+    Raises:
+        ValueError: If the preset is unknown
+    """
+    if isinstance(spec, dict):
+        return CommandEncoder(spec['command'], spec['extension'])
+    if spec not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown transcode encoder: {spec}")
+    command, extension = ENCODER_PRESETS[spec]
+    return CommandEncoder(command, extension)
+
+
+def transcode_file(encoder: CommandEncoder, source_path: str, cache_dir: str) -> tuple:
+    """
+    Transcode a file into the cache unless output for the same content exists
+
+    Runs in a pool process.
+
+    Returns:
+        tuple: (cache key, output size in bytes)
+    """
+    digest = hashlib.sha1(encoder.signature.encode('utf-8'))
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()
+
+    output_path = os.path.join(cache_dir, key + encoder.extension)
+    if not os.path.exists(output_path):
+        # The encoder picks the format from the extension, so keep it last
+        tmp_path = os.path.join(cache_dir, f"{key}.part{encoder.extension}")
+        try:
+            encoder.encode(source_path, tmp_path)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return key, os.path.getsize(output_path)
+
+
+class TranscodeCache:
+    """Content-keyed, size-budgeted cache of transcoded tracks"""
+
+    def __init__(self, cache_dir: str, budget_bytes: int, encoder: CommandEncoder,
+                 extensions: Iterable[str] = ('.flac', '.m4a'), workers: int = 1):
+        """
+        Initialize transcode cache
+
+        Args:
+            cache_dir: Directory for transcoded files and the manifest
+            budget_bytes: Maximum total size of transcoded files
+            encoder: Encoder used for new transcodes
+            extensions: Source file extensions that are transcoded
+            workers: Number of encoder processes
+        """
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.encoder = encoder
+        self.extensions = {ext.lower() for ext in extensions}
+        self.workers = max(1, workers)
+
+        # Song path -> [size, mtime_ns, cache key, or None if transcoding failed]
+        self.entries: Dict[str, list] = {}
+        # Cache key -> output size, least recently used first
+        self._outputs: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._runner = ProcessJobRunner('Transcode', self.workers, self._finished, self._idle)
+        self._dirty = False
+        self.failed = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """Load the manifest and the sizes of cached files"""
+        manifest_path = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        try:
+            with open(manifest_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading transcode manifest: {e}")
+
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            key = entry.name.split('.', 1)[0]
+            if not KEY_PATTERN.fullmatch(key) or not entry.is_file():
+                continue
+            # Partial output, or output of an encoder with another format
+            if entry.name != key + self.encoder.extension:
+                os.remove(entry.path)
+                continue
+            files.append((entry.stat().st_atime, key, entry.stat().st_size))
+
+        for _, key, size in sorted(files):
+            self._outputs[key] = size
+            self._total_bytes += size
+
+        # Forget songs whose output was removed
+        self.entries = {path: entry for path, entry in self.entries.items()
+                        if entry[2] is None or entry[2] in self._outputs}
+        logger.info(f"Transcode cache holds {len(self._outputs)} files ({self._total_bytes} bytes)")
+
+    def save(self) -> bool:
+        """Save the manifest atomically"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            data = {'version': MANIFEST_VERSION, 'entries': dict(self.entries)}
+            self._dirty = False
+
+        manifest_path = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        tmp_path = manifest_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, manifest_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving transcode manifest: {e}")
+            return False
+
+    def submit(self, paths: Iterable[str]):
+        """
+        Transcode files in the background
+
+        Only files with a transcoded extension whose size or mtime changed
+        since they were last transcoded are queued.
+
+        Args:
+            paths: Song paths
+        """
+        jobs = []
+        for path in paths:
+            if os.path.splitext(path)[1].lower() not in self.extensions:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = self.entries.get(path)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                continue
+            jobs.append(((self.encoder, path, self.cache_dir), (path, st.st_size, st.st_mtime_ns)))
+
+        if jobs and self._runner.submit(transcode_file, jobs):
+            logger.info(f"Queued {len(jobs)} tracks for transcoding")
+
+    def get_path(self, path: str) -> Optional[str]:
+        """
+        Get the transcoded copy of a song
+
+        Args:
+            path: Song path
+
+        Returns:
+            str: Path of the transcoded file, or None if there is none yet or
+                the song changed since it was transcoded; a changed song is
+                queued again
+        """
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[2] not in self._outputs:
+                return None
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            logger.info(f"{os.path.basename(path)} changed since it was transcoded")
+            self.submit([path])
+            return None
+
+        with self._lock:
+            if entry[2] not in self._outputs:
+                return None
+            self._outputs.move_to_end(entry[2])
+            return os.path.join(self.cache_dir, entry[2] + self.encoder.extension)
+
+    def pending(self) -> int:
+        """Number of submitted files not transcoded yet"""
+        return self._runner.pending()
+
+    def shutdown(self):
+        """Cancel queued transcodes and save the manifest"""
+        self._runner.shutdown()
+        self.save()
+
+    def _finished(self, job: tuple, future):
+        """Record a finished transcode and keep the cache within budget"""
+        path, size, mtime_ns = job
+        try:
+            key, output_size = future.result()
+        except Exception as e:
+            self.failed += 1
+            stderr = getattr(e, 'stderr', None)
+            detail = stderr.decode('utf-8', 'replace').strip() if stderr else e
+            logger.warning(f"Could not transcode {os.path.basename(path)}: {detail}")
+            key = None
+
+        if key and output_size > self.budget_bytes and key not in self._outputs:
+            # Would evict everything else and then itself
+            logger.warning(f"Transcode of {os.path.basename(path)} is larger than the cache budget")
+            try:
+                os.remove(os.path.join(self.cache_dir, key + self.encoder.extension))
+            except OSError:
+                pass
+            key = None
+
+        with self._lock:
+            if key:
+                if key not in self._outputs:
+                    self._outputs[key] = output_size
+                    self._total_bytes += output_size
+                self._outputs.move_to_end(key)
+            # Failures are not retried until the file changes
+            self.entries[path] = [size, mtime_ns, key]
+            self._dirty = True
+            self._evict()
+
+    def _idle(self):
+        """Save the manifest once every queued transcode has ended"""
+        logger.info("Transcoding finished")
+        self.save()
+
+    def _evict(self):
+        """Remove least recently used outputs over the budget (call with the lock held)"""
+        evicted = set()
+        while self._total_bytes > self.budget_bytes and self._outputs:
+            key, size = self._outputs.popitem(last=False)
+            self._total_bytes -= size
+            evicted.add(key)
+            try:
+                os.remove(os.path.join(self.cache_dir, key + self.encoder.extension))
+            except OSError as e:
+                logger.warning(f"Could not remove transcoded file {key}: {e}")
+
+        if evicted:
+            self.entries = {path: entry for path, entry in self.entries.items()
+                            if entry[2] is None or entry[2] not in evicted}